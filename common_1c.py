@@ -0,0 +1,1488 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Общие функции скриптов обслуживания информационных баз 1С под Linux:
+журнал выполнения, файлы настроек, команды ОС и клиент кластера серверов 1С
+(утилита rac или собственный клиент протокола RAS для операций чтения).
+
+Модуль используется скриптами backup_1c_base.py и set_1c_scheduled_jobs.py,
+а также может импортироваться другими программами:
+
+        from common_1c import ClusterClient
+
+        client = ClusterClient('/opt/1cv8/x86_64', 'srv1c', 1545)
+        infobase = client.find_infobase('accounting')
+        if infobase:
+            client.set_infobase_deny(infobase, 'scheduled-jobs-deny', 'on', admin='Администратор', password='123')
+
+Настройки журнала (DEBUG_MODE, LOG_FORMAT) общие для всего процесса.
+"""
+
+import sys
+import locale
+import os
+import os.path
+import traceback
+import json
+import uuid
+import threading
+import contextlib
+import subprocess
+import time
+import datetime
+import dataclasses
+import concurrent.futures
+import socket
+import struct
+
+try:
+    import configparser
+except ImportError:
+    print('Import error configparser')
+
+__version__ = (0, 0, 1, 1)
+
+# Режим отладки. Сообщения журнала выводятся только в режиме отладки
+DEBUG_MODE = False
+
+# Кодировка командной оболочки по умолчанию
+DEFAULT_ENCODING = sys.stdout.encoding if sys.platform.startswith('win') else locale.getpreferredencoding()
+
+# Цвета в консоли
+RED_COLOR_TEXT = '\x1b[31;1m'       # red
+GREEN_COLOR_TEXT = '\x1b[32m'       # green
+YELLOW_COLOR_TEXT = '\x1b[33;1m'    # yellow
+BLUE_COLOR_TEXT = '\x1b[34m'        # blue
+PURPLE_COLOR_TEXT = '\x1b[35m'      # purple
+CYAN_COLOR_TEXT = '\x1b[36m'        # cyan
+WHITE_COLOR_TEXT = '\x1b[37m'       # white
+NORMAL_COLOR_TEXT = '\x1b[0m'       # normal
+
+# Формат журнала:
+#   console - цветной текст для интерактивной работы
+#   json - JSON строки для журналов cron и систем мониторинга
+# Если не определен, то console при выводе на терминал, иначе json
+CONSOLE_LOG_FORMAT = 'console'
+JSON_LOG_FORMAT = 'json'
+LOG_FORMAT = None
+# Идентификатор запуска программы. Позволяет отобрать в журнале записи одного запуска
+RUN_ID = uuid.uuid4().hex[:12]
+# Вывод журнала из нескольких потоков выполняется под блокировкой,
+# а контекст (обрабатываемая база и этап) хранится отдельно для каждого потока
+LOG_LOCK = threading.Lock()
+LOG_CONTEXT = threading.local()
+
+GET_1C_CLUSTERS_CMD_FMT = '%s cluster list %s:%s'
+GET_1C_INFOBASES_CMD_FMT = '%s infobase --cluster=%s summary list %s:%s'
+GET_1C_INFOBASE_INFO_CMD_FMT = '%s infobase --cluster=%s info --infobase=%s --infobase-user=%s --infobase-pwd=%s %s:%s'
+SET_1C_INFOBASE_DENY_CMD_FMT = '%s infobase --cluster=%s update --infobase=%s --infobase-user=%s --infobase-pwd=%s --%s=%s %s:%s'
+SET_1C_INFOBASE_DENY_CODE_CMD_FMT = '%s infobase --cluster=%s update --infobase=%s --infobase-user=%s --infobase-pwd=%s --%s=%s --permission-code=%s %s:%s'
+GET_1C_INFOBASE_SESSIONS_CMD_FMT = '%s session list --cluster=%s --infobase=%s %s:%s'
+GET_1C_CLUSTER_SESSIONS_CMD_FMT = '%s session list --cluster=%s %s:%s'
+TERMINATE_1C_SESSION_CMD_FMT = '%s session --cluster=%s terminate --session=%s %s:%s'
+IS_LOCKED_1C_INFOBASE_CMD_FMT = '%s lock --cluster=%s list --infobase=%s %s:%s'
+ADMIN_1C_NAME = u'Администратор'
+ADMIN_1C_PASSWORD = '123123'
+
+# Идентификатор приложения сеансов фоновых заданий
+BACKGROUND_JOB_APP_ID = 'BackgroundJob'
+# Период опроса сеансов информационной базы в секундах
+SESSIONS_TIME_SLEEP = 10
+# Время в секундах, в течение которого список сеансов кластера используется повторно.
+# Базы одного сервера, ожидающие закрытия сеансов одновременно, опрашиваются одним вызовом rac
+SESSIONS_CACHE_TTL = 2.0
+# Количество одновременно запущенных rac при завершении сеансов
+RAC_WORKERS = 4
+
+# Транспорт клиента кластера:
+#   ras - собственный клиент протокола RAS (одно постоянное соединение с сервером,
+#         пакетная отправка запросов) для операций чтения. При ошибке протокола операции выполняет утилита rac
+#   rac - каждая операция выполняется отдельным запуском утилиты rac
+RAS_TRANSPORT = 'ras'
+RAC_TRANSPORT = 'rac'
+CLUSTER_TRANSPORTS = (RAS_TRANSPORT, RAC_TRANSPORT)
+# Формат сообщений RAS не проверен на реальном сервере ras, поэтому по умолчанию используется rac
+DEFAULT_CLUSTER_TRANSPORT = RAC_TRANSPORT
+# Операции, изменяющие кластер. Они всегда выполняются утилитой rac: при ошибке в формате
+# сообщений RAS изменение параметров базы могло бы записать в базу неверные значения
+# (например, пароль или параметры подключения к СУБД)
+CLUSTER_WRITE_OPERATIONS = ('set_infobase_deny', 'terminate_sessions')
+
+# Протокол администрирования кластера RAS.
+# Значения соответствуют общедоступным описаниям протокола (реализации клиентов RAS сторонних разработчиков)
+# Таймаут соединения и ожидания ответа сервера ras в секундах
+RAS_TIMEOUT = 30
+RAS_NEGOTIATE_MAGIC = 475223888
+RAS_PROTOCOL_VERSION = 256
+RAS_SERVICE_NAME = 'v8.service.Admin.Cluster'
+RAS_SERVICE_VERSION = '10.0'
+RAS_CONNECT_TIMEOUT = 2000
+# Типы пакетов
+RAS_NEGOTIATE = 0
+RAS_CONNECT = 1
+RAS_CONNECT_ACK = 2
+RAS_DISCONNECT = 4
+RAS_ENDPOINT_OPEN = 11
+RAS_ENDPOINT_OPEN_ACK = 12
+RAS_ENDPOINT_CLOSE = 13
+RAS_ENDPOINT_MESSAGE = 14
+RAS_ENDPOINT_FAILURE = 15
+RAS_KEEP_ALIVE = 16
+# Виды сообщений конечной точки
+RAS_VOID_MESSAGE = 0
+RAS_MESSAGE = 1
+RAS_EXCEPTION_MESSAGE = 0xFF
+# Тип значения параметра соединения
+RAS_PARAM_INT = 0x04
+# Типы сообщений службы администрирования кластера
+RAS_AUTHENTICATE_REQUEST = 9
+RAS_ADD_AUTHENTICATION_REQUEST = 10
+RAS_GET_CLUSTERS_REQUEST = 11
+RAS_GET_CLUSTERS_RESPONSE = 12
+RAS_GET_INFOBASES_SHORT_REQUEST = 42
+RAS_GET_INFOBASES_SHORT_RESPONSE = 43
+RAS_GET_INFOBASE_INFO_REQUEST = 49
+RAS_GET_INFOBASE_INFO_RESPONSE = 50
+RAS_GET_SESSIONS_REQUEST = 65
+RAS_GET_SESSIONS_RESPONSE = 66
+RAS_GET_INFOBASE_LOCKS_REQUEST = 79
+RAS_GET_INFOBASE_LOCKS_RESPONSE = 80
+# Время (тики по 100 мкс) отсчитывается от 0001-01-01
+RAS_EPOCH = datetime.datetime(1, 1, 1)
+# Поля объектов ответов в порядке их передачи: (ключ записи rac, тип значения)
+RAS_CLUSTER_FIELDS = (('cluster', 'uuid'), ('expiration-timeout', 'int'), ('host', 'str'),
+                      ('lifetime-limit', 'int'), ('port', 'short'), ('name', 'str'),
+                      ('security-level', 'int'), ('session-fault-tolerance-level', 'int'),
+                      ('load-balancing-mode', 'int'), ('errors-count-threshold', 'int'),
+                      ('kill-problem-processes', 'bool'))
+RAS_INFOBASE_SHORT_FIELDS = (('infobase', 'uuid'), ('descr', 'str'), ('name', 'str'))
+RAS_INFOBASE_FIELDS = (('infobase', 'uuid'), ('date-offset', 'int'), ('dbms', 'str'), ('db-name', 'str'),
+                       ('db-pwd', 'str'), ('db-server', 'str'), ('db-user', 'str'), ('denied-from', 'time'),
+                       ('denied-message', 'str'), ('denied-parameter', 'str'), ('denied-to', 'time'),
+                       ('descr', 'str'), ('license-distribution', 'int'), ('locale', 'str'), ('name', 'str'),
+                       ('permission-code', 'str'), ('scheduled-jobs-deny', 'bool'), ('security-level', 'int'),
+                       ('sessions-deny', 'bool'))
+RAS_SESSION_FIELDS = (('session', 'uuid'), ('app-id', 'str'), ('blocked-by-dbms', 'int'), ('blocked-by-ls', 'int'),
+                      ('bytes-all', 'long'), ('bytes-last-5min', 'long'), ('calls-all', 'int'),
+                      ('calls-last-5min', 'long'), ('connection', 'uuid'), ('host', 'str'), ('infobase', 'uuid'),
+                      ('last-active-at', 'time'), ('hibernate', 'bool'), ('locale', 'str'), ('process', 'uuid'),
+                      ('session-id', 'int'), ('started-at', 'time'), ('user-name', 'str'))
+RAS_LOCK_FIELDS = (('connection', 'uuid'), ('descr', 'str'), ('locked', 'time'), ('object', 'uuid'),
+                   ('session', 'uuid'))
+
+
+def get_default_encoding():
+    """
+    Определить актуальную кодировку для вывода текста.
+
+    :return: Актуальная кодировка для вывода текста.
+    """
+    return DEFAULT_ENCODING
+
+
+def print_color_txt(txt, color=NORMAL_COLOR_TEXT):
+    """
+    Печать цветного текста.
+
+    :param txt: Текст.
+    :param color: Консольный цвет.
+    """
+    if sys.platform.startswith('win'):
+        # Для Windows систем цветовая раскраска отключена
+        txt = txt
+    else:
+        # Добавление цветовой раскраски
+        txt = color + txt + NORMAL_COLOR_TEXT
+    print(txt)
+
+
+def get_log_format():
+    """
+    Определить актуальный формат журнала.
+
+    :return: CONSOLE_LOG_FORMAT или JSON_LOG_FORMAT.
+    """
+    if LOG_FORMAT in (CONSOLE_LOG_FORMAT, JSON_LOG_FORMAT):
+        return LOG_FORMAT
+    return CONSOLE_LOG_FORMAT if sys.stdout.isatty() else JSON_LOG_FORMAT
+
+
+def get_log_context():
+    """
+    Получить контекст журнала текущего потока.
+
+    :return: Словарь контекста: base - обрабатываемая база, phase - этап обработки.
+    """
+    return dict(base=getattr(LOG_CONTEXT, 'base', None),
+                phase=getattr(LOG_CONTEXT, 'phase', None))
+
+
+def set_log_context(**context):
+    """
+    Установить контекст журнала текущего потока.
+
+    :param context: Значения контекста (base, phase).
+    """
+    for name, value in context.items():
+        setattr(LOG_CONTEXT, name, value)
+
+
+@contextlib.contextmanager
+def log_context(**context):
+    """
+    Контекст журнала на время выполнения блока.
+    По окончании блока восстанавливается предыдущий контекст.
+
+    :param context: Значения контекста (base, phase).
+    """
+    prev_context = get_log_context()
+    set_log_context(**context)
+    try:
+        yield
+    finally:
+        set_log_context(**prev_context)
+
+
+def log_message(level, message, color=NORMAL_COLOR_TEXT, **fields):
+    """
+    Вывести запись журнала.
+    Запись выводится одной операцией записи под блокировкой,
+    поэтому записи параллельно работающих потоков не перемешиваются.
+
+    :param level: Уровень сообщения: debug, info, warning, error, fatal.
+    :param message: Текстовое сообщение.
+    :param color: Консольный цвет.
+    :param fields: Дополнительные поля записи.
+    """
+    context = get_log_context()
+    if get_log_format() == JSON_LOG_FORMAT:
+        record = dict(ts=datetime.datetime.now().isoformat(timespec='milliseconds'),
+                      level=level, run=RUN_ID,
+                      base=context['base'], phase=context['phase'],
+                      msg=message)
+        record.update(fields)
+        txt = json.dumps(record, ensure_ascii=False, default=str)
+    else:
+        txt = message
+        if level != 'info':
+            txt = '%s. %s' % (level.upper(), txt)
+        if context['base']:
+            txt = '[%s] %s' % (context['base'], txt)
+        if fields.get('trace', None):
+            txt += u'\n' + fields['trace']
+        if not sys.platform.startswith('win'):
+            # Добавление цветовой раскраски
+            txt = color + txt + NORMAL_COLOR_TEXT
+
+    with LOG_LOCK:
+        sys.stdout.write(txt + '\n')
+        sys.stdout.flush()
+
+
+def debug(message=u''):
+    """
+    Вывести ОТЛАДОЧНУЮ информацию.
+
+    :param message: Текстовое сообщение.
+    """
+    if DEBUG_MODE:
+        log_message('debug', message, BLUE_COLOR_TEXT)
+
+
+def info(message=u''):
+    """
+    Вывести ТЕКСТОВУЮ информацию.
+
+    :param message: Текстовое сообщение.
+    """
+    if DEBUG_MODE:
+        log_message('info', message, GREEN_COLOR_TEXT)
+
+
+def error(message=u''):
+    """
+    Вывести информацию ОБ ОШИБКЕ.
+
+    :param message: Текстовое сообщение.
+    """
+    if DEBUG_MODE:
+        log_message('error', message, RED_COLOR_TEXT)
+
+
+def warning(message=u''):
+    """
+    Вывести информацию ОБ ПРЕДУПРЕЖДЕНИИ.
+
+    :param message: Текстовое сообщение.
+    """
+    if DEBUG_MODE:
+        log_message('warning', message, YELLOW_COLOR_TEXT)
+
+
+def fatal(message=u''):
+    """
+    Вывести информацию ОБ ОШИБКЕ.
+
+    :param message: Текстовое сообщение.
+    """
+    if not DEBUG_MODE:
+        return
+
+    trace_txt = traceback.format_exc()
+
+    if not isinstance(message, str):
+        message = str(message)
+    if not isinstance(trace_txt, str):
+        trace_txt = str(trace_txt)
+
+    log_message('fatal', message, RED_COLOR_TEXT, trace=trace_txt)
+
+
+def ini2dict(ini_filename, encoding=DEFAULT_ENCODING):
+    """
+    Загрузить INI файл как словарь.
+
+    :param ini_filename: Полное имя INI файла настроек.
+    :return: Словарь настроек или None в случае ошибки.
+    """
+    ini_file = None
+    try:
+        if not os.path.exists(ini_filename):
+            warning(u'INI файл <%s> не найден' % ini_filename)
+            return None
+
+        ini_parser = configparser.ConfigParser()
+        ini_file = open(ini_filename, 'rt', encoding=encoding)
+        ini_parser.read_file(ini_file)
+        ini_file.close()
+
+        ini_dict = {}
+        sections = ini_parser.sections()
+        for section in sections:
+            params = ini_parser.options(section)
+            ini_dict[section] = {}
+            for param in params:
+                param_str = ini_parser.get(section, param)
+                try:
+                    # Perhaps in the form of a parameter is recorded a dictionary / list / None / number, etc.
+                    param_value = eval(param_str)
+                except:
+                    # No, it's a string.
+                    param_value = param_str
+
+                debug(u'\t%s.%s = %s' % (section, param, param_value))
+
+                ini_dict[section][param] = param_value
+
+        return ini_dict
+    except:
+        if ini_file:
+            ini_file.close()
+        fatal(u'Error converting INI file <%s> to dictionary' % ini_filename)
+    return None
+
+
+def dict2ini(src_dictionary, ini_filename, rewrite=False, encoding=DEFAULT_ENCODING):
+    """
+    Записать словарь в INI файл.
+
+    :param src_dictionary: Исходный словарь.
+    :param ini_filename: Полное имя INI файла настроек.
+    :param rewrite: Перезаписать существующий INI файл?
+    :return: True/False.
+    """
+    ini_file = None
+    try:
+        if not src_dictionary:
+            warning(u'No dictionary defined for saving to INI file. <%s>' % src_dictionary)
+            return False
+
+        ini_file_name = os.path.split(ini_filename)
+        path = ini_file_name[0]
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        if not os.path.exists(ini_filename) or rewrite:
+            ini_file = open(ini_filename, 'wt', encoding=encoding)
+            ini_file.write('')
+            ini_file.close()
+
+        ini_parser = configparser.ConfigParser()
+        ini_file = open(ini_filename, 'rt', encoding=encoding)
+        ini_parser.read_file(ini_file)
+        ini_file.close()
+
+        for section in src_dictionary.keys():
+            section_str = str(section)
+            if not ini_parser.has_section(section_str):
+                ini_parser.add_section(section_str)
+
+            for param in src_dictionary[section].keys():
+                param_name = str(param)
+                param_value = str(src_dictionary[section][param])
+                debug(u'Установка значения в INI файл <%s> [%s].%s = %s' % (ini_filename, section_str, param_name, param_value))
+                ini_parser.set(section_str, param_name, param_value)
+
+        ini_file = open(ini_filename, 'wt', encoding=encoding)
+        ini_parser.write(ini_file)
+        ini_file.close()
+
+        return True
+    except:
+        if ini_file:
+            ini_file.close()
+        fatal(u'Error saving dictionary in INI file <%s>' % ini_filename)
+    return False
+
+
+def get_lines_exec_cmd(cmd):
+    """
+    Получить строки - результат выполнения команды системы.
+
+    :param cmd: Комманда ОС.
+    :return: Список строк или пустой список в случае ошибки.
+    """
+    lines = list()
+    try:
+        info(u'Выполнение команды <%s>' % cmd)
+
+        cmd_list = cmd.split(' ')
+        process = subprocess.Popen(cmd_list, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        b_stdout, b_stderr = process.communicate()
+        console_encoding = locale.getpreferredencoding()
+        lines = [line.strip() for line in b_stdout.decode(console_encoding, errors='replace').splitlines()]
+        for line in b_stderr.decode(console_encoding, errors='replace').splitlines():
+            if line.strip():
+                warning(line.strip())
+    except:
+        fatal(u'Ошибка получения результатов выполнения команды ОС <%s>' % cmd)
+    return lines
+
+
+def parse_rac_records(lines):
+    """
+    Разобрать результат выполнения команды rac на записи.
+    Записи разделены пустыми строками, каждая строка записи имеет вид <ключ : значение>.
+
+    :param lines: Список строк результата выполнения команды rac.
+    :return: Список словарей записей.
+    """
+    records = list()
+    record = dict()
+    for line in lines:
+        line = line.strip()
+        if not line:
+            if record:
+                records.append(record)
+                record = dict()
+            continue
+        if ':' in line:
+            key, value = line.split(':', 1)
+            record[key.strip()] = value.strip().strip('"')
+    if record:
+        records.append(record)
+    return records
+
+
+class BackupCancelled(Exception):
+    """
+    Создание резервной копии отменено оператором.
+    """
+
+
+@dataclasses.dataclass(frozen=True)
+class Infobase:
+    """
+    Информационная база 1С кластера серверов.
+    """
+    cluster_id: str
+    infobase_id: str
+    name: str
+
+
+@dataclasses.dataclass(frozen=True)
+class Session:
+    """
+    Сеанс информационной базы 1С.
+    """
+    session_id: str
+    infobase_id: str = ''
+    app_id: str = ''
+    user_name: str = ''
+    started_at: str = ''
+
+    @classmethod
+    def from_record(cls, record):
+        """
+        Создать сеанс по записи результата команды rac session list.
+        """
+        return cls(session_id=record.get('session', ''),
+                   infobase_id=record.get('infobase', ''),
+                   app_id=record.get('app-id', ''),
+                   user_name=record.get('user-name', ''),
+                   started_at=record.get('started-at', ''))
+
+
+class RasError(Exception):
+    """
+    Ошибка соединения с сервером ras или протокола RAS.
+    После нее операции клиента кластера выполняются утилитой rac.
+    """
+
+
+class RasServerError(Exception):
+    """
+    Ошибка операции, которую вернул сервер ras (например, неверный пароль администратора).
+    Выводится в журнал так же, как сообщения rac.
+    """
+
+
+def ras_pack_size(value):
+    """
+    Упаковать размер (длину строки, количество элементов) в формат RAS.
+    Первый байт содержит 6 бит значения и признак продолжения 0x40,
+    следующие байты - по 7 бит значения и признак продолжения 0x80.
+
+    :param value: Неотрицательное целое.
+    :return: bytes.
+    """
+    data = bytearray()
+    byte = value & 0x3F
+    value >>= 6
+    if value:
+        byte |= 0x40
+    data.append(byte)
+    while value:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            byte |= 0x80
+        data.append(byte)
+    return bytes(data)
+
+
+def ras_unpack_size(read_byte, nullable=False):
+    """
+    Распаковать размер в формате RAS.
+
+    :param read_byte: Функция чтения следующего байта (int).
+    :param nullable: Допускается пустое значение (байт 0x80)?
+    :return: Размер или None для пустого значения.
+    """
+    byte = read_byte()
+    if nullable and byte == 0x80:
+        return None
+    value = byte & 0x3F
+    shift = 6
+    more = byte & 0x40
+    while more:
+        byte = read_byte()
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        more = byte & 0x80
+    return value
+
+
+def ras_pack_value(value_type, value):
+    """
+    Упаковать значение в формат RAS.
+
+    :param value_type: Тип значения: byte, bool, short, int, long, time, uuid, str.
+    :param value: Значение. None упаковывается как пустое значение типа.
+    :return: bytes.
+    """
+    if value_type == 'str':
+        data = (value or '').encode('utf-8')
+        return ras_pack_size(len(data)) + data
+    if value_type == 'uuid':
+        return uuid.UUID(value).bytes if value else bytes(16)
+    if value_type in ('byte', 'bool'):
+        return bytes([int(bool(value)) if value_type == 'bool' else int(value or 0)])
+    if value_type == 'short':
+        return struct.pack('>h', int(value or 0))
+    if value_type == 'int':
+        return struct.pack('>i', int(value or 0))
+    if value_type in ('long', 'time'):
+        return struct.pack('>q', int(value or 0))
+    raise RasError('Unsupported RAS value type <%s>' % value_type)
+
+
+def ras_pack_fields(fields, values):
+    """
+    Упаковать объект по описанию его полей.
+
+    :param fields: Описание полей: последовательность (ключ, тип значения).
+    :param values: Словарь значений. Отсутствующие поля упаковываются пустыми значениями.
+    :return: bytes.
+    """
+    return b''.join([ras_pack_value(value_type, values.get(key, None)) for key, value_type in fields])
+
+
+def ras_pack_packet(packet_type, body):
+    """
+    Упаковать пакет RAS: тип, размер тела и тело.
+    """
+    return bytes([packet_type]) + ras_pack_size(len(body)) + body
+
+
+def ras_record(values, fields):
+    """
+    Преобразовать значения объекта RAS в запись формата результатов rac.
+
+    :param values: Словарь значений объекта (см. RasReader.read_fields).
+    :param fields: Описание полей объекта.
+    :return: Словарь <ключ rac: строка>.
+    """
+    record = dict()
+    for key, value_type in fields:
+        value = values.get(key, None)
+        if value_type == 'bool':
+            record[key] = 'on' if value else 'off'
+        elif value_type == 'time':
+            try:
+                record[key] = (RAS_EPOCH + datetime.timedelta(microseconds=value * 100)).strftime('%Y-%m-%dT%H:%M:%S') if value else ''
+            except OverflowError:
+                raise RasError('Invalid RAS time value %d of <%s>' % (value, key))
+        else:
+            record[key] = '' if value is None else str(value)
+    return record
+
+
+class RasReader(object):
+    """
+    Чтение значений из тела сообщения RAS.
+    """
+    def __init__(self, data):
+        """
+        Конструктор.
+
+        :param data: Тело сообщения (bytes).
+        """
+        self.data = data
+        self.offset = 0
+        # Тип сообщения ответа конечной точки
+        self.message_type = None
+
+    def read(self, size):
+        """
+        Прочитать size байт.
+        """
+        if self.offset + size > len(self.data):
+            raise RasError('Unexpected end of RAS message')
+        data = self.data[self.offset:self.offset + size]
+        self.offset += size
+        return data
+
+    def read_byte(self):
+        """
+        Прочитать байт как целое.
+        """
+        return self.read(1)[0]
+
+    def read_size(self, nullable=False):
+        """
+        Прочитать размер.
+        """
+        return ras_unpack_size(self.read_byte, nullable=nullable)
+
+    def read_value(self, value_type):
+        """
+        Прочитать значение.
+
+        :param value_type: Тип значения (см. ras_pack_value).
+        :return: Значение. uuid возвращается строкой, time - количеством тиков.
+        """
+        if value_type == 'str':
+            size = self.read_size(nullable=True)
+            return '' if size is None else self.read(size).decode('utf-8', errors='replace')
+        if value_type == 'uuid':
+            return str(uuid.UUID(bytes=self.read(16)))
+        if value_type == 'byte':
+            return self.read_byte()
+        if value_type == 'bool':
+            return self.read_byte() != 0
+        if value_type == 'short':
+            return struct.unpack('>h', self.read(2))[0]
+        if value_type == 'int':
+            return struct.unpack('>i', self.read(4))[0]
+        if value_type in ('long', 'time'):
+            return struct.unpack('>q', self.read(8))[0]
+        raise RasError('Unsupported RAS value type <%s>' % value_type)
+
+    def read_fields(self, fields):
+        """
+        Прочитать объект по описанию его полей.
+
+        :return: Словарь значений.
+        """
+        return dict([(key, self.read_value(value_type)) for key, value_type in fields])
+
+    def read_list(self, fields):
+        """
+        Прочитать список объектов: количество и объекты.
+
+        :return: Список словарей значений.
+        """
+        return [self.read_fields(fields) for i in range(self.read_size())]
+
+    def check_end(self):
+        """
+        Проверить, что сообщение прочитано полностью.
+        Лишние данные означают, что формат объектов сервера отличается от ожидаемого.
+        """
+        if self.offset != len(self.data):
+            raise RasError('Unexpected %d bytes at the end of RAS message' % (len(self.data) - self.offset))
+
+
+def ras_read_records(reader, fields):
+    """
+    Прочитать список объектов ответа целиком и преобразовать в записи формата rac.
+    """
+    records = [ras_record(values, fields) for values in reader.read_list(fields)]
+    reader.check_end()
+    return records
+
+
+def ras_pack_auth(cluster_id, user, password):
+    """
+    Упаковать тело запроса аутентификации: кластер, пользователь, пароль.
+    """
+    return ras_pack_value('uuid', cluster_id) + ras_pack_value('str', user) + ras_pack_value('str', password)
+
+
+class RasConnection(object):
+    """
+    Соединение с сервером ras: согласование протокола, открытие конечной точки
+    службы администрирования кластера и обмен сообщениями.
+    Запросы отправляются пакетом без ожидания ответов, ответы читаются в порядке запросов.
+    Соединение не защищено блокировкой: его использует RasTransport под своей блокировкой.
+    """
+    def __init__(self, host, port, timeout=RAS_TIMEOUT):
+        """
+        Конструктор.
+
+        :param host: Сервер ras.
+        :param port: Порт сервера ras.
+        :param timeout: Таймаут соединения и ожидания ответа в секундах.
+        """
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.sock = None
+        self.stream = None
+        self.endpoint_id = None
+
+    def open(self):
+        """
+        Открыть соединение и конечную точку службы администрирования кластера.
+        """
+        self.sock = socket.create_connection((self.host, int(self.port)), timeout=self.timeout)
+        self.stream = self.sock.makefile('rb')
+        params = ras_pack_size(1) + ras_pack_value('str', 'connect.timeout') + \
+            bytes([RAS_PARAM_INT]) + ras_pack_value('int', RAS_CONNECT_TIMEOUT)
+        self.sock.sendall(struct.pack('>iHH', RAS_NEGOTIATE_MAGIC, RAS_PROTOCOL_VERSION, RAS_PROTOCOL_VERSION) +
+                          ras_pack_packet(RAS_CONNECT, params))
+        self.read_packet(RAS_CONNECT_ACK)
+
+        self.sock.sendall(ras_pack_packet(RAS_ENDPOINT_OPEN, ras_pack_value('str', RAS_SERVICE_NAME) +
+                                          ras_pack_value('str', RAS_SERVICE_VERSION) + ras_pack_size(0)))
+        reader = self.read_packet(RAS_ENDPOINT_OPEN_ACK)
+        reader.read_value('str')
+        reader.read_value('str')
+        self.endpoint_id = reader.read_size()
+
+    def close(self):
+        """
+        Закрыть соединение.
+        """
+        for obj in (self.stream, self.sock):
+            if obj is not None:
+                try:
+                    obj.close()
+                except OSError:
+                    pass
+        self.sock = None
+        self.stream = None
+
+    def read_exact(self, size):
+        """
+        Прочитать из соединения ровно size байт.
+        """
+        data = self.stream.read(size)
+        if len(data) != size:
+            raise ConnectionError('RAS server <%s:%s> closed the connection' % (self.host, self.port))
+        return data
+
+    def read_packet(self, packet_type):
+        """
+        Прочитать пакет ожидаемого типа. Пакеты поддержания соединения пропускаются.
+
+        :return: RasReader тела пакета.
+        """
+        while True:
+            received_type = self.read_exact(1)[0]
+            body = self.read_exact(ras_unpack_size(lambda: self.read_exact(1)[0]))
+            if received_type == RAS_KEEP_ALIVE:
+                continue
+            if received_type in (RAS_ENDPOINT_FAILURE, RAS_DISCONNECT):
+                raise RasError('RAS server <%s:%s> closed the endpoint (packet type %d)' % (self.host, self.port,
+                                                                                          received_type))
+            if received_type != packet_type:
+                raise RasError('Unexpected RAS packet type %d instead of %d' % (received_type, packet_type))
+            return RasReader(body)
+
+    def call_many(self, messages):
+        """
+        Отправить сообщения конечной точке одним пакетом и прочитать ответы.
+
+        :param messages: Список (тип сообщения, тело сообщения).
+        :return: Список ответов в порядке сообщений: RasReader (тип в message_type),
+            None - пустой ответ, RasServerError - ошибка операции.
+        """
+        header = ras_pack_size(self.endpoint_id) + ras_pack_value('short', 0) + ras_pack_value('byte', RAS_MESSAGE)
+        self.sock.sendall(b''.join([ras_pack_packet(RAS_ENDPOINT_MESSAGE, header + bytes([message_type]) + body)
+                                    for message_type, body in messages]))
+        responses = list()
+        for i in range(len(messages)):
+            reader = self.read_packet(RAS_ENDPOINT_MESSAGE)
+            reader.read_size()
+            reader.read_value('short')
+            kind = reader.read_byte()
+            if kind == RAS_VOID_MESSAGE:
+                responses.append(None)
+            elif kind == RAS_MESSAGE:
+                reader.message_type = reader.read_byte()
+                responses.append(reader)
+            elif kind == RAS_EXCEPTION_MESSAGE:
+                name = reader.read_value('str')
+                message = reader.read_value('str') if reader.offset < len(reader.data) else ''
+                responses.append(RasServerError(message or name))
+            else:
+                raise RasError('Unexpected RAS message kind %d' % kind)
+        return responses
+
+
+class ClusterTransport(object):
+    """
+    Транспорт клиента кластера - способ выполнения операций администрирования кластера.
+    Операции возвращают записи в формате результатов rac (словари <ключ rac: строка>),
+    поэтому ClusterClient не зависит от транспорта.
+    """
+    name = None
+
+    def get_clusters(self):
+        """
+        Получить записи кластеров сервера.
+        """
+        raise NotImplementedError
+
+    def get_infobases(self, cluster_ids):
+        """
+        Получить краткие записи информационных баз кластеров.
+
+        :param cluster_ids: Список идентификаторов кластеров.
+        :return: Список пар (идентификатор кластера, запись базы).
+        """
+        raise NotImplementedError
+
+    def get_infobase_info(self, cluster_id, infobase_id, admin, password):
+        """
+        Получить запись параметров информационной базы.
+
+        :return: Запись или пустой словарь, если параметры не получены.
+        """
+        raise NotImplementedError
+
+    def set_infobase_deny(self, cluster_id, infobase_id, param, value, admin, password, permission_code=None):
+        """
+        Вкл./Выкл. блокировку информационной базы (см. ClusterClient.set_infobase_deny).
+
+        :return: Строки сообщений. При успешном выполнении - пустой список.
+        """
+        raise NotImplementedError
+
+    def get_sessions(self, cluster_id):
+        """
+        Получить записи сеансов всех информационных баз кластера.
+        """
+        raise NotImplementedError
+
+    def terminate_sessions(self, cluster_id, session_ids, workers=RAC_WORKERS):
+        """
+        Завершить сеансы кластера.
+
+        :param session_ids: Список идентификаторов сеансов.
+        :param workers: Количество одновременно выполняемых операций, если транспорт выполняет их по одной.
+        :return: Список строк сообщений для каждого сеанса в порядке session_ids.
+        """
+        raise NotImplementedError
+
+    def get_locks(self, cluster_id, infobase_id):
+        """
+        Получить блокировки информационной базы.
+
+        :return: Строки описания блокировок. Пустой список - блокировок нет.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """
+        Освободить ресурсы транспорта.
+        """
+        pass
+
+
+class RacTransport(ClusterTransport):
+    """
+    Транспорт через утилиту rac: каждая операция - отдельный запуск rac.
+    """
+    name = RAC_TRANSPORT
+
+    def __init__(self, path_1c, host, port):
+        """
+        Конструктор.
+
+        :param path_1c: Путь к установленным программам 1С.
+        :param host: Сервер 1С.
+        :param port: Порт утилиты ras.
+        """
+        self.rac_filename = os.path.join(path_1c, 'rac')
+        self.host = host
+        self.port = port
+
+    def get_clusters(self):
+        cmd = GET_1C_CLUSTERS_CMD_FMT % (self.rac_filename, self.host, self.port)
+        return parse_rac_records(get_lines_exec_cmd(cmd))
+
+    def get_infobases(self, cluster_ids):
+        infobases = list()
+        for cluster_id in cluster_ids:
+            cmd = GET_1C_INFOBASES_CMD_FMT % (self.rac_filename, cluster_id, self.host, self.port)
+            infobases += [(cluster_id, record) for record in parse_rac_records(get_lines_exec_cmd(cmd))]
+        return infobases
+
+    def get_infobase_info(self, cluster_id, infobase_id, admin, password):
+        cmd = GET_1C_INFOBASE_INFO_CMD_FMT % (self.rac_filename, cluster_id, infobase_id,
+                                              admin, password, self.host, self.port)
+        records = parse_rac_records(get_lines_exec_cmd(cmd))
+        return records[0] if records else dict()
+
+    def set_infobase_deny(self, cluster_id, infobase_id, param, value, admin, password, permission_code=None):
+        if permission_code:
+            cmd = SET_1C_INFOBASE_DENY_CODE_CMD_FMT % (self.rac_filename, cluster_id, infobase_id,
+                                                       admin, password, param, value, permission_code,
+                                                       self.host, self.port)
+        else:
+            cmd = SET_1C_INFOBASE_DENY_CMD_FMT % (self.rac_filename, cluster_id, infobase_id,
+                                                  admin, password, param, value, self.host, self.port)
+        return get_lines_exec_cmd(cmd)
+
+    def get_sessions(self, cluster_id):
+        cmd = GET_1C_CLUSTER_SESSIONS_CMD_FMT % (self.rac_filename, cluster_id, self.host, self.port)
+        return parse_rac_records(get_lines_exec_cmd(cmd))
+
+    def terminate_sessions(self, cluster_id, session_ids, workers=RAC_WORKERS):
+        # Команды rac выполняются одновременно (не больше workers)
+        if not session_ids:
+            return list()
+        context = get_log_context()
+
+        def terminate_task(session_id):
+            with log_context(**context):
+                cmd = TERMINATE_1C_SESSION_CMD_FMT % (self.rac_filename, cluster_id, session_id, self.host, self.port)
+                return get_lines_exec_cmd(cmd)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(workers, len(session_ids)))) as executor:
+            return list(executor.map(terminate_task, session_ids))
+
+    def get_locks(self, cluster_id, infobase_id):
+        cmd = IS_LOCKED_1C_INFOBASE_CMD_FMT % (self.rac_filename, cluster_id, infobase_id, self.host, self.port)
+        return get_lines_exec_cmd(cmd)
+
+
+class RasTransport(ClusterTransport):
+    """
+    Собственный клиент протокола RAS. Выполняет только операции чтения,
+    изменения кластера выполняет утилита rac (см. CLUSTER_WRITE_OPERATIONS).
+    Клиент держит одно постоянное соединение с сервером ras: согласование протокола
+    и открытие конечной точки выполняются один раз, а не при каждом запуске rac.
+    Запросы одной операции (аутентификация в кластере и базе, списки баз нескольких кластеров)
+    отправляются пакетом без ожидания ответа на каждый.
+    Ошибки соединения и протокола выбрасываются (RasError, OSError),
+    ошибки операций, которые вернул сервер, выводятся в журнал, как сообщения rac.
+    """
+    name = RAS_TRANSPORT
+
+    def __init__(self, host, port, cluster_user='', cluster_password='', timeout=RAS_TIMEOUT):
+        """
+        Конструктор.
+
+        :param host: Сервер 1С.
+        :param port: Порт утилиты ras.
+        :param cluster_user: Администратор кластера. По умолчанию без аутентификации, как rac.
+        :param cluster_password: Пароль администратора кластера.
+        :param timeout: Таймаут соединения и ожидания ответа в секундах.
+        """
+        self.host = host
+        self.port = port
+        self.cluster_user = cluster_user
+        self.cluster_password = cluster_password
+        self.timeout = timeout
+        self.connection = None
+        # Кластеры, в которых текущее соединение аутентифицировано
+        self.authenticated = set()
+        self.lock = threading.Lock()
+
+    def call(self, requests):
+        """
+        Выполнить запросы одним пакетом.
+        Перед первым запросом к кластеру в соединении добавляется аутентификация администратора кластера.
+        Если сервер закрыл повторно используемое соединение (например, по простою),
+        то соединение открывается заново и запросы отправляются еще раз.
+
+        :param requests: Список (идентификатор кластера или None, тип сообщения, тело сообщения).
+        :return: Список ответов в порядке запросов (см. RasConnection.call_many).
+        """
+        with self.lock:
+            reused = self.connection is not None
+            try:
+                return self.call_connection(requests)
+            except OSError:
+                self.close_connection()
+                if not reused:
+                    raise
+            except RasError:
+                self.close_connection()
+                raise
+
+            info(u'Повторное соединение с сервером ras <%s:%s>' % (self.host, self.port))
+            try:
+                return self.call_connection(requests)
+            except (RasError, OSError):
+                self.close_connection()
+                raise
+
+    def call_connection(self, requests):
+        """
+        Выполнить запросы в текущем соединении, открыв его при необходимости.
+        """
+        if self.connection is None:
+            info(u'Соединение с сервером ras <%s:%s>' % (self.host, self.port))
+            connection = RasConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                connection.open()
+            except:
+                connection.close()
+                raise
+            self.connection = connection
+            self.authenticated = set()
+
+        messages = list()
+        positions = list()
+        # Позиции запросов аутентификации в кластерах
+        authentications = dict()
+        for cluster_id, message_type, body in requests:
+            if cluster_id and cluster_id not in self.authenticated and cluster_id not in authentications:
+                authentications[cluster_id] = len(messages)
+                messages.append((RAS_AUTHENTICATE_REQUEST,
+                                 ras_pack_auth(cluster_id, self.cluster_user, self.cluster_password)))
+            positions.append(len(messages))
+            messages.append((message_type, body))
+
+        responses = self.connection.call_many(messages)
+        for cluster_id, position in authentications.items():
+            self.check_response(responses[position])
+            self.authenticated.add(cluster_id)
+        return [responses[position] for position in positions]
+
+    def close_connection(self):
+        """
+        Закрыть текущее соединение.
+        """
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def close(self):
+        with self.lock:
+            self.close_connection()
+
+    @staticmethod
+    def check_response(response, response_type=None):
+        """
+        Проверить ответ сервера.
+
+        :param response: Ответ (см. RasConnection.call_many).
+        :param response_type: Ожидаемый тип сообщения ответа. None - ожидается пустой ответ.
+        :return: RasReader ответа или None для пустого ответа.
+        """
+        if isinstance(response, RasServerError):
+            raise response
+        if response_type is None and response is not None:
+            raise RasError('Unexpected RAS response message type %d' % response.message_type)
+        if response_type is not None and (response is None or response.message_type != response_type):
+            raise RasError('Unexpected RAS response instead of message type %d' % response_type)
+        return response
+
+    def request(self, cluster_id, message_type, body, response_type=None):
+        """
+        Выполнить один запрос и проверить ответ.
+        """
+        return self.check_response(self.call([(cluster_id, message_type, body)])[0], response_type)
+
+    def server_warning(self, exc):
+        """
+        Вывести в журнал ошибку операции, которую вернул сервер ras.
+        """
+        warning(u'Ошибка сервера ras <%s:%s>: %s' % (self.host, self.port, exc))
+
+    def get_clusters(self):
+        try:
+            reader = self.request(None, RAS_GET_CLUSTERS_REQUEST, b'', RAS_GET_CLUSTERS_RESPONSE)
+        except RasServerError as exc:
+            self.server_warning(exc)
+            return list()
+        return ras_read_records(reader, RAS_CLUSTER_FIELDS)
+
+    def get_infobases(self, cluster_ids):
+        try:
+            responses = self.call([(cluster_id, RAS_GET_INFOBASES_SHORT_REQUEST, ras_pack_value('uuid', cluster_id))
+                                   for cluster_id in cluster_ids])
+        except RasServerError as exc:
+            self.server_warning(exc)
+            return list()
+        infobases = list()
+        for cluster_id, response in zip(cluster_ids, responses):
+            try:
+                reader = self.check_response(response, RAS_GET_INFOBASES_SHORT_RESPONSE)
+            except RasServerError as exc:
+                self.server_warning(exc)
+                continue
+            infobases += [(cluster_id, record) for record in ras_read_records(reader, RAS_INFOBASE_SHORT_FIELDS)]
+        return infobases
+
+    def read_infobase_values(self, cluster_id, infobase_id, admin, password):
+        """
+        Получить значения параметров информационной базы.
+        Аутентификация в базе и запрос параметров отправляются одним пакетом.
+
+        :return: Словарь значений полей RAS_INFOBASE_FIELDS.
+        """
+        responses = self.call([(cluster_id, RAS_ADD_AUTHENTICATION_REQUEST, ras_pack_auth(cluster_id, admin, password)),
+                               (cluster_id, RAS_GET_INFOBASE_INFO_REQUEST,
+                                ras_pack_value('uuid', cluster_id) + ras_pack_value('uuid', infobase_id))])
+        self.check_response(responses[0])
+        reader = self.check_response(responses[1], RAS_GET_INFOBASE_INFO_RESPONSE)
+        values = reader.read_fields(RAS_INFOBASE_FIELDS)
+        reader.check_end()
+        return values
+
+    def get_infobase_info(self, cluster_id, infobase_id, admin, password):
+        try:
+            return ras_record(self.read_infobase_values(cluster_id, infobase_id, admin, password), RAS_INFOBASE_FIELDS)
+        except RasServerError as exc:
+            self.server_warning(exc)
+            return dict()
+
+    def get_sessions(self, cluster_id):
+        try:
+            reader = self.request(cluster_id, RAS_GET_SESSIONS_REQUEST, ras_pack_value('uuid', cluster_id),
+                                  RAS_GET_SESSIONS_RESPONSE)
+        except RasServerError as exc:
+            self.server_warning(exc)
+            return list()
+        return ras_read_records(reader, RAS_SESSION_FIELDS)
+
+    def get_locks(self, cluster_id, infobase_id):
+        try:
+            reader = self.request(cluster_id, RAS_GET_INFOBASE_LOCKS_REQUEST,
+                                  ras_pack_value('uuid', cluster_id) + ras_pack_value('uuid', infobase_id),
+                                  RAS_GET_INFOBASE_LOCKS_RESPONSE)
+        except RasServerError as exc:
+            self.server_warning(exc)
+            return list()
+        lines = list()
+        for record in ras_read_records(reader, RAS_LOCK_FIELDS):
+            lines += ['%s : %s' % (key, value) for key, value in record.items()]
+        return lines
+
+
+class ClusterClient(object):
+    """
+    Клиент кластера серверов 1С.
+    Операции выполняет транспорт: собственный клиент протокола RAS (RasTransport)
+    или утилита rac (RacTransport). Изменения кластера всегда выполняет утилита rac.
+    При ошибке соединения или протокола RAS клиент переходит на утилиту rac до конца работы.
+    Объект не хранит состояния, кроме соединения с ras, списка информационных баз сервера и
+    недавнего списка сеансов кластера, поэтому один клиент используется для всех баз
+    одного сервера, в том числе из нескольких потоков: список баз запрашивается у сервера
+    один раз, а сеансы всех баз, ожидающих закрытия сеансов, - одним запросом.
+    """
+    def __init__(self, path_1c, host, port, transport=None):
+        """
+        Конструктор.
+
+        :param path_1c: Путь к установленным программам 1С
+            Например: /opt/1cv8/x86_64
+        :param host: Сервер 1С.
+        :param port: Порт утилиты ras
+            На сервере приложений 1С должна быть запущена утилита ras в режиме демона:
+            /opt/1cv8/x86_64/ras --daemon cluster --port=1545
+        :param transport: Транспорт: ras - собственный клиент протокола RAS, rac - утилита rac.
+            Если не определен, то DEFAULT_CLUSTER_TRANSPORT.
+        """
+        transport = transport or DEFAULT_CLUSTER_TRANSPORT
+        if transport not in CLUSTER_TRANSPORTS:
+            raise ValueError('Unknown cluster transport <%s>' % transport)
+        self.rac = RacTransport(path_1c, host, port)
+        self.rac_filename = self.rac.rac_filename
+        self.host = host
+        self.port = port
+        self.transport = RasTransport(host, port) if transport == RAS_TRANSPORT else self.rac
+        self.infobases = None
+        self.lock = threading.Lock()
+        # Списки сеансов кластеров. Ключ - идентификатор кластера, значение - (время запроса, список Session)
+        self.sessions = dict()
+        self.sessions_lock = threading.Lock()
+
+    def call(self, operation, *args, **kwargs):
+        """
+        Выполнить операцию транспорта.
+        Операции CLUSTER_WRITE_OPERATIONS выполняются утилитой rac.
+        При ошибке соединения или протокола RAS операция и все последующие выполняются утилитой rac.
+
+        :param operation: Имя метода транспорта (см. ClusterTransport).
+        :return: Результат операции.
+        """
+        transport = self.transport
+        if transport is not self.rac and operation not in CLUSTER_WRITE_OPERATIONS:
+            try:
+                return getattr(transport, operation)(*args, **kwargs)
+            except (RasError, OSError) as exc:
+                warning(u'Ошибка соединения или протокола RAS сервера <%s:%s>: %s. Операции кластера выполняются утилитой rac' % (self.host, self.port, exc))
+                self.transport = self.rac
+                transport.close()
+        return getattr(self.rac, operation)(*args, **kwargs)
+
+    def close(self):
+        """
+        Закрыть соединение с сервером ras.
+        """
+        self.transport.close()
+
+    def get_clusters(self):
+        """
+        Получить список идентификаторов кластеров сервера.
+        """
+        return [cluster['cluster'] for cluster in self.call('get_clusters') if cluster.get('cluster', None)]
+
+    def get_infobases(self, use_cache=True):
+        """
+        Получить список информационных баз 1С всех кластеров сервера.
+
+        :param use_cache: Использовать ранее полученный список?
+        :return: Список Infobase.
+        """
+        # Список запрашиваем под блокировкой, чтобы параллельные обработчики
+        # одного сервера не запрашивали его повторно
+        with self.lock:
+            if use_cache and self.infobases:
+                return self.infobases
+
+            infobases = [Infobase(cluster_id, infobase['infobase'], infobase.get('name', ''))
+                         for cluster_id, infobase in self.call('get_infobases', self.get_clusters())
+                         if infobase.get('infobase', None)]
+            self.infobases = infobases
+        return infobases
+
+    def find_infobase(self, name):
+        """
+        Найти информационную базу 1С по имени.
+        Проверку по имени баз 1с делаем регистронечувствительной.
+
+        :param name: Наименование информационной базы 1C.
+        :return: Infobase или None, если база не найдена.
+        """
+        for infobase in self.get_infobases():
+            if infobase.name.lower() == name.strip().lower():
+                return infobase
+        return None
+
+    def get_infobase_info(self, infobase, admin=ADMIN_1C_NAME, password=ADMIN_1C_PASSWORD):
+        """
+        Получить параметры информационной базы 1С.
+
+        :param infobase: Информационная база (Infobase).
+        :param admin: Администратор 1С.
+        :param password: Пароль администратора 1С.
+        :return: Словарь параметров или пустой словарь, если параметры не получены.
+        """
+        return self.call('get_infobase_info', infobase.cluster_id, infobase.infobase_id, admin, password)
+
+    def get_infobase_deny(self, infobase, param, admin=ADMIN_1C_NAME, password=ADMIN_1C_PASSWORD):
+        """
+        Прочитать текущий режим блокировки информационной базы 1С.
+
+        :param infobase: Информационная база (Infobase).
+        :param param: Свойство информационной базы: sessions-deny или scheduled-jobs-deny.
+        :param admin: Администратор 1С.
+        :param password: Пароль администратора 1С.
+        :return: True - блокировка включена, False - отключена, None - режим не удалось определить.
+        """
+        value = self.get_infobase_info(infobase, admin=admin, password=password).get(param, None)
+        if value in ('on', 'off'):
+            return value == 'on'
+        return None
+
+    def set_infobase_deny(self, infobase, param, value, admin=ADMIN_1C_NAME, password=ADMIN_1C_PASSWORD,
+                          permission_code=None):
+        """
+        Вкл./Выкл. блокировку информационной базы 1С.
+
+        :param infobase: Информационная база (Infobase).
+        :param param: Свойство информационной базы: sessions-deny или scheduled-jobs-deny.
+        :param value: 'on' или 'off'.
+        :param admin: Администратор 1С.
+        :param password: Пароль администратора 1С.
+        :param permission_code: Код разрешения, с которым можно подключиться к базе
+            при включенной блокировке начала сеансов (ключ /UC 1cv8).
+        :return: Строки сообщений об ошибках. При успешном выполнении - пустой список.
+        """
+        lines = self.call('set_infobase_deny', infobase.cluster_id, infobase.infobase_id, param, value,
+                          admin, password, permission_code=permission_code)
+        self.reset_sessions(infobase.cluster_id)
+        return lines
+
+    def get_cluster_sessions(self, cluster_id, max_age=SESSIONS_CACHE_TTL):
+        """
+        Получить список сеансов всех информационных баз кластера.
+        Одновременные запросы из нескольких потоков выполняются одним запросом,
+        полученный список используется повторно в течение max_age секунд.
+
+        :param cluster_id: Идентификатор кластера.
+        :param max_age: Допустимый возраст списка в секундах. 0 - запросить заново.
+        :return: Список Session.
+        """
+        with self.sessions_lock:
+            requested_at, sessions = self.sessions.get(cluster_id, (None, None))
+            if requested_at is not None and time.time() - requested_at <= max_age:
+                return sessions
+            requested_at = time.time()
+            sessions = [Session.from_record(record) for record in self.call('get_sessions', cluster_id)]
+            self.sessions[cluster_id] = (requested_at, sessions)
+        return sessions
+
+    def reset_sessions(self, cluster_id):
+        """
+        Сбросить список сеансов кластера после изменений: следующий запрос получит его заново.
+        """
+        with self.sessions_lock:
+            self.sessions.pop(cluster_id, None)
+
+    def get_sessions(self, infobase, app_id=None, max_age=SESSIONS_CACHE_TTL):
+        """
+        Получить список сеансов информационной базы 1С.
+
+        :param infobase: Информационная база (Infobase).
+        :param app_id: Идентификатор приложения для отбора сеансов.
+            Если не определен, то возвращаются все сеансы.
+        :param max_age: Допустимый возраст списка сеансов кластера в секундах (см. get_cluster_sessions).
+        :return: Список Session.
+        """
+        return [session for session in self.get_cluster_sessions(infobase.cluster_id, max_age=max_age)
+                if session.infobase_id == infobase.infobase_id and (app_id is None or session.app_id == app_id)]
+
+    def terminate_session(self, infobase, session):
+        """
+        Завершить сеанс информационной базы 1С.
+
+        :param infobase: Информационная база (Infobase).
+        :param session: Сеанс (Session).
+        :return: Строки сообщений об ошибках.
+        """
+        return self.terminate_sessions(infobase, [session])[0][1]
+
+    def terminate_sessions(self, infobase, sessions, workers=RAC_WORKERS):
+        """
+        Завершить сеансы информационной базы 1С.
+        Команды rac выполняются одновременно (не больше workers).
+
+        :param infobase: Информационная база (Infobase).
+        :param sessions: Список Session.
+        :param workers: Количество одновременно запущенных rac.
+        :return: Список пар (Session, строки сообщений об ошибках) в порядке sessions.
+        """
+        if not sessions:
+            return list()
+        results = self.call('terminate_sessions', infobase.cluster_id,
+                            [session.session_id for session in sessions], workers=workers)
+        self.reset_sessions(infobase.cluster_id)
+        return list(zip(sessions, results))
+
+    def get_locks(self, infobase):
+        """
+        Получить блокировки информационной базы 1С.
+
+        :param infobase: Информационная база (Infobase).
+        :return: Строки описания блокировок в формате rac lock list.
+        """
+        return self.call('get_locks', infobase.cluster_id, infobase.infobase_id)
+
+    def wait_sessions(self, infobase, app_id=None, timeout=None, time_sleep=SESSIONS_TIME_SLEEP, cancel_event=None):
+        """
+        Ожидать закрытия сеансов информационной базы 1С.
+        Сеансы опрашиваются до их закрытия или до истечения времени ожидания.
+
+        :param infobase: Информационная база (Infobase).
+        :param app_id: Идентификатор приложения для отбора сеансов.
+            Например BackgroundJob для сеансов фоновых заданий.
+        :param timeout: Максимальное время ожидания в секундах.
+        :param time_sleep: Период опроса сеансов в секундах.
+        :param cancel_event: Событие (threading.Event) прерывания ожидания.
+        :return: True - сеансы закрыты / False - истекло время ожидания или ожидание прервано.
+        """
+        start_time = time.time()
+        deadline = start_time + float(timeout or 0)
+        while True:
+            sessions = self.get_sessions(infobase, app_id=app_id, max_age=min(SESSIONS_CACHE_TTL, time_sleep))
+            if not sessions:
+                info(u'Сеансы информационной базы 1С <%s> закрыты ... %s' % (infobase.name, time.time() - start_time))
+                return True
+
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                warning(u'Истекло время ожидания закрытия сеансов информационной базы 1С <%s>:' % infobase.name)
+                for session in sessions:
+                    warning(u'\tСеанс [%s] <%s> пользователя <%s> запущен <%s>' % (session.session_id, session.app_id,
+                                                                                   session.user_name, session.started_at))
+                return False
+
+            info(u'Ожидание закрытия сеансов [%d] информационной базы 1С <%s>. Осталось %d сек.' % (len(sessions), infobase.name, remaining))
+            if cancel_event is None:
+                time.sleep(min(time_sleep, remaining))
+            elif cancel_event.wait(min(time_sleep, remaining)):
+                warning(u'Ожидание закрытия сеансов информационной базы 1С <%s> прервано' % infobase.name)
+                return False
+
+
+def get_cluster_client(path_1c, host, port, clients=None, transport=None):
+    """
+    Получить клиент кластера серверов 1С.
+
+    :param path_1c: Путь к установленным программам 1С.
+    :param host: Сервер 1С.
+    :param port: Порт утилиты ras.
+    :param clients: Словарь уже созданных клиентов. Ключ - (path_1c, host, port, transport).
+        Если определен, то клиент одного сервера создается один раз
+        и все базы сервера используют одно соединение с ras.
+    :param transport: Транспорт клиента: ras или rac. Если не определен, то DEFAULT_CLUSTER_TRANSPORT.
+    :return: ClusterClient.
+    """
+    transport = transport or DEFAULT_CLUSTER_TRANSPORT
+    if clients is None:
+        return ClusterClient(path_1c, host, port, transport=transport)
+    key = (path_1c, host, str(port), transport)
+    if key not in clients:
+        clients[key] = ClusterClient(path_1c, host, port, transport=transport)
+    return clients[key]
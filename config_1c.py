@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Параметры запуска резервного копирования информационных баз 1С (BackupConfig):
+параметры командной строки и секции SETTINGS файла настроек, значения по умолчанию.
+
+Параметры передаются выполняемым функциям и заданиям явно.
+Настройки журнала (common_1c.DEBUG_MODE, common_1c.LOG_FORMAT) в параметры запуска
+не входят: журнал общий для всего процесса и всех модулей.
+"""
+
+import os
+import os.path
+import datetime
+import dataclasses
+import typing
+
+from common_1c import warning
+from report_1c import (DEFAULT_SMTP_SERVER_PORT, DEFAULT_ATTACHMENT_MAX_SIZE, DEFAULT_REPORT_OUTBOX_DIRNAME,
+                       DEFAULT_REPORT_SEND_TIMEOUT, DEFAULT_REPORT_RETRY_DELAY, BackupReport)
+
+# Имя INI файла настроек по умолчанию
+DEFAULT_SETTINGS_INI_FILENAME = './settings.ini'
+# Дата запуска в теме письма отчета
+BACKUP_DATE_BLOCK = '{{ BACKUP_DATE }}'
+
+# Файлы рядом с файлом настроек:
+# история длительности создания резервных копий
+DEFAULT_HISTORY_FILENAME = 'history.json'
+# результаты калибровки параметров монтирования NFS ресурсов (--nfs_calibrate)
+DEFAULT_NFS_PROFILES_FILENAME = 'nfs_profiles.json'
+
+# Сжатие резервной копии при копировании на ресурсы хранения
+# auto - кодек и уровень подбираются для каждой базы, none - без сжатия,
+# <кодек>:<уровень> - явно указанное сжатие (например gzip:6)
+DEFAULT_COMPRESS = 'none'
+# Проверяемые при подборе варианты сжатия
+DEFAULT_COMPRESS_CANDIDATES = ('none', 'gzip:1', 'gzip:6', 'bz2:1', 'xz:0')
+
+# Копирование на file:// и nfs:// ресурсы средствами ядра (copy_file_range/sendfile)
+# без передачи данных через память процесса
+DEFAULT_KERNEL_COPY = True
+# Предварительное выделение места под файл на ресурсе (fallocate) против фрагментации
+DEFAULT_PREALLOCATE = True
+# Сброс данных на диск ресурса: none - не сбрасывать, close - по окончании записи,
+# interval - каждые storage_1c.FSYNC_INTERVAL байт (ограничивает объем не записанных данных в кэше)
+DEFAULT_FSYNC_POLICY = 'close'
+FSYNC_POLICIES = ('none', 'close', 'interval')
+# Большие файлы записываются на file:// и nfs:// ресурсы сегментами upload_segment_size байт
+# в upload_streams потоков, каждый сегмент проверяется и повторяется отдельно.
+# upload_streams = 1 - запись одним потоком
+DEFAULT_UPLOAD_STREAMS = 4
+DEFAULT_UPLOAD_SEGMENT_SIZE = 256 * 1024 * 1024
+
+
+@dataclasses.dataclass
+class BackupConfig:
+    """
+    Параметры запуска программы: параметры командной строки и секции SETTINGS файла настроек,
+    а также общие для всех баз ресурсы запуска (журнал, пул дисплеев, публикация хода, отчет).
+    Передаются выполняемым функциям и заданиям явно.
+    """
+    settings_filename: str = DEFAULT_SETTINGS_INI_FILENAME
+    dialog_mode: bool = False
+    # Отчет по почте
+    report_enable: typing.Optional[bool] = None
+    report_from: typing.Optional[str] = None
+    report_to: tuple = ()
+    report_subject: str = ''
+    smtp_server: typing.Optional[str] = ''
+    smtp_server_port: int = DEFAULT_SMTP_SERVER_PORT
+    smtp_login: typing.Optional[str] = None
+    smtp_password: typing.Optional[str] = None
+    report_attached: tuple = ()
+    report_attachment_max_size: int = DEFAULT_ATTACHMENT_MAX_SIZE
+    report_attachment_compress: bool = True
+    report_outbox: typing.Optional[str] = None
+    report_send_timeout: float = DEFAULT_REPORT_SEND_TIMEOUT
+    report_retry_delay: float = DEFAULT_REPORT_RETRY_DELAY
+    # Файл истории запусков. Если не определен, то история не ведется
+    history_filename: typing.Optional[str] = None
+    verify_backup: bool = True
+    preflight: bool = True
+    queue_dir: typing.Optional[str] = None
+    # Профили монтирования NFS ресурсов (секция NFS_PROFILES) и результаты калибровки (--nfs_calibrate)
+    nfs_profiles: dict = dataclasses.field(default_factory=dict)
+    nfs_profiles_filename: typing.Optional[str] = None
+    # Сжатие и шифрование
+    compress: str = DEFAULT_COMPRESS
+    compress_candidates: tuple = DEFAULT_COMPRESS_CANDIDATES
+    encrypt_key: typing.Optional[str] = None
+    decrypt_key: typing.Optional[str] = None
+    # Запись на file:// и nfs:// ресурсы
+    kernel_copy: bool = DEFAULT_KERNEL_COPY
+    preallocate: bool = DEFAULT_PREALLOCATE
+    fsync_policy: str = DEFAULT_FSYNC_POLICY
+    upload_streams: int = DEFAULT_UPLOAD_STREAMS
+    upload_segment_size: int = DEFAULT_UPLOAD_SEGMENT_SIZE
+    metrics_filename: typing.Optional[str] = None
+    progress_socket: typing.Optional[str] = None
+    # Ресурсы запуска: журнал изменений состояния кластера (ClusterStateJournal),
+    # пул виртуальных дисплеев (XvfbDisplayPool), публикация хода (ProgressPublisher)
+    journal: typing.Any = None
+    xvfb_pool: typing.Any = None
+    progress_publisher: typing.Any = None
+    report: BackupReport = dataclasses.field(default_factory=BackupReport)
+
+    @classmethod
+    def from_settings(cls, settings=None, settings_filename=DEFAULT_SETTINGS_INI_FILENAME, **options):
+        """
+        Создать параметры запуска по секции SETTINGS файла настроек.
+
+        :param settings: Словарь настроек (ini2dict). Если не определен, то используются значения по умолчанию.
+        :param settings_filename: Файл настроек. Рядом с ним по умолчанию размещаются
+            очередь отчетов, файл истории и результаты калибровки NFS.
+        :param options: Параметры, заданные явно (например, в командной строке).
+            Переопределяют значения файла настроек. Значения None не учитываются.
+        :return: BackupConfig.
+        """
+        options = dict([(key, value) for key, value in options.items() if value is not None])
+        section = settings.get('SETTINGS', dict()) if settings else dict()
+        # Если отправка отчета не включена явно, то параметры отправки берем из настроек
+        if 'report_enable' not in options and settings:
+            for key in ('report_enable', 'report_from', 'report_to', 'report_subject',
+                        'smtp_server', 'smtp_server_port', 'smtp_login', 'smtp_password'):
+                if key in section:
+                    options[key] = section[key]
+        # Остальные параметры, не заданные явно, также берем из настроек
+        for key in ('report_attached', 'report_attachment_max_size', 'report_attachment_compress', 'report_outbox',
+                    'report_send_timeout', 'report_retry_delay', 'history_filename', 'verify_backup', 'preflight',
+                    'queue_dir', 'nfs_profiles_filename', 'compress', 'compress_candidates',
+                    'encrypt_key', 'decrypt_key', 'kernel_copy', 'preallocate', 'fsync_policy',
+                    'upload_streams', 'upload_segment_size', 'metrics_filename', 'progress_socket'):
+            if key not in options and section.get(key, None) is not None:
+                options[key] = section[key]
+
+        settings_dirname = os.path.dirname(os.path.abspath(settings_filename))
+        options.setdefault('report_outbox', os.path.join(settings_dirname, DEFAULT_REPORT_OUTBOX_DIRNAME))
+        options.setdefault('history_filename', os.path.join(settings_dirname, DEFAULT_HISTORY_FILENAME))
+        options.setdefault('nfs_profiles_filename', os.path.join(settings_dirname, DEFAULT_NFS_PROFILES_FILENAME))
+        if settings:
+            options.setdefault('nfs_profiles', settings.get('NFS_PROFILES', dict()))
+        for key in ('report_to', 'report_attached'):
+            if isinstance(options.get(key, None), str):
+                options[key] = (options[key], )
+        if 'report_subject' in options:
+            options['report_subject'] = options['report_subject'].replace(BACKUP_DATE_BLOCK,
+                                                                          str(datetime.date.today()))
+        for key in ('verify_backup', 'preflight'):
+            if key in options:
+                options[key] = options[key] is not False
+        if 'upload_streams' in options:
+            options['upload_streams'] = max(1, int(options['upload_streams']))
+        if 'upload_segment_size' in options:
+            options['upload_segment_size'] = int(options['upload_segment_size'])
+        if options.get('fsync_policy', DEFAULT_FSYNC_POLICY) not in FSYNC_POLICIES:
+            warning(u'Не поддерживаемый режим сброса на диск <%s>. Используется close' % options['fsync_policy'])
+            options['fsync_policy'] = 'close'
+        return cls(settings_filename=settings_filename, **options)
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Шифрование резервных копий информационных баз 1С (AES-256-GCM) потоком при копировании
+на ресурсы хранения и расшифровка при проверке и восстановлении.
+
+Формат файла: заголовок (ENCRYPT_MAGIC, длина и JSON описание с зашифрованным ключом данных),
+затем блоки по ENCRYPT_CHUNK_SIZE байт исходных данных с тегом аутентификации каждый.
+Номер блока входит в nonce, а признак последнего блока - в дополнительные данные шифрования,
+поэтому перестановка блоков и обрезание файла обнаруживаются при расшифровке.
+
+Необходимый пакет:
+sudo apt install python3-cryptography
+"""
+
+import os
+import json
+import hashlib
+import struct
+import base64
+
+# Необязательный пакет для шифрования резервных копий
+try:
+    from cryptography.exceptions import InvalidTag
+    from cryptography.hazmat.primitives import hashes, keywrap, serialization
+    from cryptography.hazmat.primitives.asymmetric import padding, rsa
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+except ImportError:
+    AESGCM = None
+
+from storage_1c import read_full
+
+# Ключ данных создается для каждой резервной копии и сохраняется в заголовке файла,
+# зашифрованный открытым ключом RSA (PEM) или ключом из файла (32 байта).
+# Для расшифровки нужен закрытый ключ RSA или тот же файл ключа
+ENCRYPT_SUFFIX = '.enc'
+ENCRYPT_MAGIC = b'1CBKENC1'
+ENCRYPT_CHUNK_SIZE = 1024 * 1024
+ENCRYPT_KEY_SIZE = 32
+ENCRYPT_TAG_SIZE = 16
+ENCRYPT_CIPHER = 'AES-256-GCM'
+ENCRYPT_MAX_HEADER_SIZE = 64 * 1024
+
+
+def check_cryptography():
+    """
+    Проверить наличие пакета cryptography, необходимого для шифрования.
+    """
+    if AESGCM is None:
+        raise ImportError(u'Import error cryptography. Install: sudo apt install python3-cryptography')
+
+
+def load_encryption_key(key_filename):
+    """
+    Загрузить ключ шифрования резервных копий.
+
+    :param key_filename: Файл ключа: открытый или закрытый ключ RSA в формате PEM
+        или файл ключа из 32 байт (допускается запись в шестнадцатеричном виде).
+    :return: Кортеж (тип ключа, ключ): ('rsa', ключ RSA) или ('file', байты ключа).
+    """
+    check_cryptography()
+    with open(key_filename, 'rb') as key_file:
+        data = key_file.read()
+    if data.lstrip().startswith(b'-----BEGIN'):
+        if b'PRIVATE KEY' in data:
+            return 'rsa', serialization.load_pem_private_key(data, password=None)
+        return 'rsa', serialization.load_pem_public_key(data)
+    if len(data) != ENCRYPT_KEY_SIZE:
+        try:
+            data = bytes.fromhex(data.decode('ascii').strip())
+        except ValueError:
+            pass
+    if len(data) != ENCRYPT_KEY_SIZE:
+        raise ValueError(u'Key file <%s> must contain %d bytes or a PEM RSA key' % (key_filename, ENCRYPT_KEY_SIZE))
+    return 'file', data
+
+
+def get_key_id(key_type, key):
+    """
+    Отпечаток ключа шифрования. Сохраняется в заголовке зашифрованного файла,
+    чтобы при расшифровке отличать неверный ключ от поврежденного файла.
+    """
+    if key_type == 'rsa':
+        if isinstance(key, rsa.RSAPrivateKey):
+            key = key.public_key()
+        data = key.public_bytes(serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo)
+    else:
+        data = key
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def get_rsa_padding():
+    """
+    Дополнение RSA-OAEP для шифрования ключа данных.
+    """
+    return padding.OAEP(mgf=padding.MGF1(algorithm=hashes.SHA256()), algorithm=hashes.SHA256(), label=None)
+
+
+class StreamEncryptor(object):
+    """
+    Потоковое шифрование AES-256-GCM.
+
+    Формат файла: ENCRYPT_MAGIC, длина заголовка (4 байта), заголовок JSON, блоки.
+    Каждый блок - не более chunk_size байт данных, зашифрованных отдельно
+    с меткой аутентификации. Номер блока входит в nonce, а заголовок, номер блока
+    и признак последнего блока - в дополнительные данные, поэтому перестановка,
+    удаление и обрезание блоков обнаруживаются при расшифровке.
+    В памяти находится не более одного блока.
+    """
+    def __init__(self, key_filename, chunk_size=ENCRYPT_CHUNK_SIZE):
+        """
+        Конструктор.
+
+        :param key_filename: Файл ключа (см. load_encryption_key).
+        :param chunk_size: Размер блока данных.
+        """
+        key_type, key = load_encryption_key(key_filename)
+        data_key = AESGCM.generate_key(bit_length=ENCRYPT_KEY_SIZE * 8)
+        if key_type == 'rsa':
+            public_key = key.public_key() if isinstance(key, rsa.RSAPrivateKey) else key
+            wrapped_key = public_key.encrypt(data_key, get_rsa_padding())
+            wrap = 'RSA-OAEP-SHA256'
+        else:
+            wrapped_key = keywrap.aes_key_wrap(key, data_key)
+            wrap = 'AES-KW'
+        self.nonce_prefix = os.urandom(8)
+        header = json.dumps(dict(cipher=ENCRYPT_CIPHER, chunk_size=chunk_size, wrap=wrap,
+                                 key_id=get_key_id(key_type, key),
+                                 wrapped_key=base64.b64encode(wrapped_key).decode('ascii'),
+                                 nonce=base64.b64encode(self.nonce_prefix).decode('ascii'))).encode('utf-8')
+        self.header = ENCRYPT_MAGIC + struct.pack('>I', len(header)) + header
+        self.chunk_size = chunk_size
+        self.data_key = data_key
+        self.aesgcm = AESGCM(data_key)
+        self.index = 0
+        self.buffer = bytearray()
+        self.started = False
+
+    def copy(self):
+        """
+        Новый поток шифрования с тем же ключом данных, префиксом nonce и заголовком.
+        Те же исходные данные шифруются в те же байты: nonce повторяется только
+        для тех же блоков открытых данных, поэтому повторное шифрование ничего не раскрывает.
+
+        :return: StreamEncryptor, начинающий поток сначала.
+        """
+        encryptor = StreamEncryptor.__new__(StreamEncryptor)
+        encryptor.nonce_prefix = self.nonce_prefix
+        encryptor.header = self.header
+        encryptor.chunk_size = self.chunk_size
+        encryptor.data_key = self.data_key
+        encryptor.aesgcm = AESGCM(self.data_key)
+        encryptor.index = 0
+        encryptor.buffer = bytearray()
+        encryptor.started = False
+        return encryptor
+
+    def seal(self, data, final):
+        """
+        Зашифровать блок.
+        """
+        nonce = self.nonce_prefix + struct.pack('>I', self.index)
+        sealed = self.aesgcm.encrypt(nonce, data, self.header + struct.pack('>IB', self.index, final))
+        self.index += 1
+        return sealed
+
+    def encrypt(self, data):
+        """
+        Зашифровать очередную порцию данных.
+        Последний блок остается в буфере до вызова flush.
+
+        :return: Зашифрованные данные (в начале потока - вместе с заголовком).
+        """
+        chunks = list()
+        if not self.started:
+            chunks.append(self.header)
+            self.started = True
+        self.buffer += data
+        while len(self.buffer) > self.chunk_size:
+            chunks.append(self.seal(bytes(self.buffer[:self.chunk_size]), False))
+            del self.buffer[:self.chunk_size]
+        return b''.join(chunks)
+
+    def flush(self):
+        """
+        Зашифровать последний блок.
+        """
+        chunks = [self.encrypt(b'')]
+        chunks.append(self.seal(bytes(self.buffer), True))
+        self.buffer = bytearray()
+        return b''.join(chunks)
+
+
+def read_encryption_header(src_file):
+    """
+    Прочитать заголовок зашифрованного файла.
+
+    :param src_file: Поток зашифрованного файла.
+    :return: Кортеж (словарь заголовка, байты заголовка целиком).
+    """
+    magic = read_full(src_file, len(ENCRYPT_MAGIC) + 4)
+    if len(magic) < len(ENCRYPT_MAGIC) + 4 or magic[:len(ENCRYPT_MAGIC)] != ENCRYPT_MAGIC:
+        raise ValueError(u'Not an encrypted backup file')
+    header_size = struct.unpack('>I', magic[len(ENCRYPT_MAGIC):])[0]
+    if header_size > ENCRYPT_MAX_HEADER_SIZE:
+        raise ValueError(u'Encrypted backup header is too large')
+    header = read_full(src_file, header_size)
+    if len(header) < header_size:
+        raise ValueError(u'Encrypted backup header is truncated')
+    params = json.loads(header.decode('utf-8'))
+    if params.get('cipher', None) != ENCRYPT_CIPHER:
+        raise ValueError(u'Unsupported cipher <%s>' % params.get('cipher', None))
+    return params, magic + header
+
+
+class DecryptingReader(object):
+    """
+    Поток расшифрованных данных файла, зашифрованного StreamEncryptor.
+    Блоки расшифровываются по мере чтения. Поврежденный, обрезанный
+    или дополненный файл вызывает ValueError.
+    """
+    def __init__(self, src_file, key_filename):
+        """
+        Конструктор.
+
+        :param src_file: Поток зашифрованного файла (объект с методом read).
+        :param key_filename: Закрытый ключ RSA или файл ключа, которым файл был зашифрован.
+        """
+        key_type, key = load_encryption_key(key_filename)
+        params, self.header = read_encryption_header(src_file)
+        if params.get('key_id', None) != get_key_id(key_type, key):
+            raise ValueError(u'Backup is encrypted with another key <%s>' % params.get('key_id', None))
+        wrapped_key = base64.b64decode(params['wrapped_key'])
+        if key_type == 'rsa':
+            if not isinstance(key, rsa.RSAPrivateKey):
+                raise ValueError(u'Private RSA key is required for decryption')
+            data_key = key.decrypt(wrapped_key, get_rsa_padding())
+        else:
+            data_key = keywrap.aes_key_unwrap(key, wrapped_key)
+        self.src_file = src_file
+        self.aesgcm = AESGCM(data_key)
+        self.nonce_prefix = base64.b64decode(params['nonce'])
+        self.block_size = int(params['chunk_size']) + ENCRYPT_TAG_SIZE
+        self.index = 0
+        self.next_block = read_full(src_file, self.block_size)
+        self.finished = False
+        self.buffer = bytearray()
+
+    def read_block(self):
+        """
+        Расшифровать очередной блок в буфер.
+        Признак последнего блока определяется чтением следующего блока.
+
+        :return: False - данные закончились.
+        """
+        if self.finished:
+            return False
+        block = self.next_block
+        if len(block) < ENCRYPT_TAG_SIZE:
+            raise ValueError(u'Encrypted backup is truncated at block %d' % self.index)
+        self.next_block = read_full(self.src_file, self.block_size)
+        final = not self.next_block
+        nonce = self.nonce_prefix + struct.pack('>I', self.index)
+        try:
+            self.buffer += self.aesgcm.decrypt(nonce, block, self.header + struct.pack('>IB', self.index, final))
+        except InvalidTag:
+            raise ValueError(u'Encrypted block %d is corrupted or the file is truncated' % self.index)
+        self.index += 1
+        self.finished = final
+        return True
+
+    def read(self, size=-1):
+        while (size < 0 or len(self.buffer) < size) and self.read_block():
+            pass
+        if size < 0:
+            size = len(self.buffer)
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Общая очередь информационных баз 1С для нескольких клиентских машин (--coordinator/--worker).
+
+Очередь - папка на общем ресурсе. Базы переходят между состояниями атомарным переименованием
+файлов, взятая база арендуется обработчиком (WorkQueue). Аренду на время обработки
+продлевает LeaseKeeper.
+"""
+
+import os
+import os.path
+import json
+import uuid
+import threading
+import time
+import shutil
+import datetime
+
+from common_1c import info, warning, fatal
+
+# Состояния (папки запуска) и имена файлов очереди
+QUEUE_STATES = ('pending', 'claimed', 'done')
+QUEUE_ITEM_FMT = '%04d-%s'
+QUEUE_LEASE_SUFFIX = '.lease'
+QUEUE_CURRENT_FILENAME = 'current.json'
+# Аренда базы обработчиком в секундах и период ее продления
+QUEUE_LEASE_TIMEOUT = 600
+QUEUE_LEASE_RENEW = 60
+# Количество попыток обработки базы при истечении аренды
+QUEUE_MAX_ATTEMPTS = 3
+# Период опроса очереди в секундах
+QUEUE_POLL_TIME_SLEEP = 5
+# Количество хранимых папок запусков
+QUEUE_KEEP_RUNS = 5
+
+
+class WorkQueue(object):
+    """
+    Общая очередь информационных баз для нескольких клиентских машин 1С.
+
+    Очередь - папка на общем ресурсе (например, смонтированном NFS ресурсе хранения).
+    Каждый запуск координатора создает папку запуска со вложенными папками:
+        pending - базы, ожидающие обработки;
+        claimed - базы, взятые в обработку, и файлы аренды (<элемент>.lease);
+        done - результаты обработки.
+    Переходы между папками выполняются атомарным переименованием файла,
+    поэтому базу может взять только один обработчик.
+    Обработчик периодически продлевает аренду. Базы с истекшей арендой
+    (обработчик завершился аварийно) возвращаются в очередь.
+    Аренду продлевает и результат записывает только ее владелец: если аренда истекла
+    и база взята другим обработчиком, то прежний обработчик прекращает обработку.
+    Часы клиентских машин должны быть синхронизированы (NTP).
+    """
+    def __init__(self, queue_dir):
+        """
+        Конструктор.
+
+        :param queue_dir: Папка очереди.
+        """
+        self.queue_dir = queue_dir
+        self.run_dir = None
+
+    def get_path(self, state, item=None):
+        """
+        Путь к папке состояния или к элементу очереди.
+        """
+        path = os.path.join(self.run_dir, state)
+        return os.path.join(path, item) if item else path
+
+    def create(self, run_id, base_names):
+        """
+        Создать новый запуск и поставить базы в очередь.
+        Базы берутся обработчиками в указанном порядке.
+
+        :param run_id: Идентификатор запуска.
+        :param base_names: Список имен секций баз в файле настроек.
+        """
+        self.run_dir = os.path.join(self.queue_dir, run_id)
+        for state in QUEUE_STATES:
+            os.makedirs(self.get_path(state), exist_ok=True)
+        for order, base_name in enumerate(base_names):
+            item = QUEUE_ITEM_FMT % (order, base_name)
+            self.write_json(self.get_path('pending', item), dict(base=base_name, attempts=0))
+        self.write_json(os.path.join(self.queue_dir, QUEUE_CURRENT_FILENAME),
+                        dict(run=run_id, created=datetime.datetime.now().isoformat(timespec='seconds')))
+        self.cleanup(keep_run_id=run_id)
+        info(u'Запуск <%s>: в очередь <%s> поставлено баз [%d]' % (run_id, self.queue_dir, len(base_names)))
+
+    def open_current(self, timeout=0):
+        """
+        Подключиться к текущему запуску.
+
+        :param timeout: Время ожидания создания запуска координатором в секундах.
+        :return: Идентификатор запуска или None, если запуск не найден.
+        """
+        stop_time = time.time() + timeout
+        while True:
+            current = self.read_json(os.path.join(self.queue_dir, QUEUE_CURRENT_FILENAME))
+            if current and os.path.isdir(os.path.join(self.queue_dir, current.get('run', ''))):
+                self.run_dir = os.path.join(self.queue_dir, current['run'])
+                return current['run']
+            if time.time() >= stop_time:
+                return None
+            time.sleep(QUEUE_POLL_TIME_SLEEP)
+
+    def list_items(self, state):
+        """
+        Список элементов в состоянии, по порядку постановки в очередь.
+        """
+        return sorted([item for item in os.listdir(self.get_path(state)) if not item.endswith(QUEUE_LEASE_SUFFIX)
+                       and not item.startswith('.')])
+
+    def claim(self, worker_id):
+        """
+        Взять из очереди следующую базу.
+
+        :param worker_id: Идентификатор обработчика.
+        :return: Кортеж (элемент очереди, имя базы) или None, если очередь пуста.
+        """
+        for item in self.list_items('pending'):
+            try:
+                os.rename(self.get_path('pending', item), self.get_path('claimed', item))
+            except FileNotFoundError:
+                # Базу уже взял другой обработчик
+                continue
+            self.write_lease(item, worker_id)
+            data = self.read_json(self.get_path('claimed', item)) or dict()
+            return item, data.get('base', None)
+        return None
+
+    def write_lease(self, item, worker_id):
+        """
+        Записать аренду базы обработчиком.
+        """
+        self.write_json(self.get_path('claimed', item + QUEUE_LEASE_SUFFIX),
+                        dict(worker=worker_id, expires=time.time() + QUEUE_LEASE_TIMEOUT))
+
+    def is_owner(self, item, worker_id):
+        """
+        Аренда базы принадлежит обработчику?
+        Аренды нет, если база возвращена в очередь после ее истечения.
+        """
+        lease = self.read_json(self.get_path('claimed', item + QUEUE_LEASE_SUFFIX))
+        return bool(lease) and lease.get('worker', None) == worker_id
+
+    def renew(self, item, worker_id):
+        """
+        Продлить аренду базы.
+
+        :param item: Элемент очереди.
+        :param worker_id: Идентификатор обработчика.
+        :return: True - аренда продлена / False - аренда потеряна: истекла или принадлежит другому обработчику.
+        """
+        if not self.is_owner(item, worker_id):
+            return False
+        self.write_lease(item, worker_id)
+        return True
+
+    def complete(self, item, worker_id, result):
+        """
+        Записать результат обработки базы и убрать ее из обрабатываемых.
+
+        :param item: Элемент очереди.
+        :param worker_id: Идентификатор обработчика.
+        :param result: Словарь результата.
+        :return: True - результат записан / False - аренда была потеряна и база возвращена в очередь.
+        """
+        if not self.is_owner(item, worker_id):
+            warning(u'Аренда <%s> истекла до окончания обработки' % item)
+            return False
+        try:
+            os.rename(self.get_path('claimed', item), self.get_path('done', item))
+        except FileNotFoundError:
+            warning(u'Аренда <%s> истекла до окончания обработки' % item)
+            return False
+        data = self.read_json(self.get_path('done', item)) or dict()
+        data.update(result)
+        self.write_json(self.get_path('done', item), data)
+        self.remove_lease(item)
+        return True
+
+    def remove_lease(self, item):
+        """
+        Удалить файл аренды.
+        """
+        try:
+            os.remove(self.get_path('claimed', item + QUEUE_LEASE_SUFFIX))
+        except FileNotFoundError:
+            pass
+
+    def requeue_expired(self):
+        """
+        Вернуть в очередь базы с истекшей арендой.
+        Если количество попыток исчерпано, то база считается не обработанной.
+
+        :return: Количество возвращенных баз.
+        """
+        count = 0
+        now = time.time()
+        for item in self.list_items('claimed'):
+            lease = self.read_json(self.get_path('claimed', item + QUEUE_LEASE_SUFFIX))
+            if lease:
+                expires = lease.get('expires', 0)
+            else:
+                # Аренда еще не записана обработчиком, только что взявшим базу
+                try:
+                    expires = os.stat(self.get_path('claimed', item)).st_ctime + QUEUE_LEASE_TIMEOUT
+                except FileNotFoundError:
+                    continue
+            if expires > now:
+                continue
+
+            data = self.read_json(self.get_path('claimed', item)) or dict()
+            attempts = data.get('attempts', 0) + 1
+            state = 'pending' if attempts < QUEUE_MAX_ATTEMPTS else 'done'
+            # Аренда удаляется до возврата базы в очередь: аренда нового обработчика не будет удалена,
+            # а прежний обработчик при продлении узнает о потере аренды
+            self.remove_lease(item)
+            try:
+                os.rename(self.get_path('claimed', item), self.get_path(state, item))
+            except FileNotFoundError:
+                continue
+            data.update(attempts=attempts)
+            if state == 'done':
+                data.update(result=False, error=u'Аренда истекла %d раз' % attempts)
+            self.write_json(self.get_path(state, item), data)
+            warning(u'Аренда базы <%s> обработчиком <%s> истекла. Попытка %d' % (data.get('base', item),
+                                                                                (lease or dict()).get('worker', ''),
+                                                                                attempts))
+            count += 1
+        return count
+
+    def fail_unfinished(self, error_text):
+        """
+        Отметить не обработанными базы, не взятые в обработку, и базы с истекшей арендой.
+        Базы, аренду которых обработчики еще продлевают, остаются в обработке:
+        обработчик сможет записать их результат позже.
+
+        :param error_text: Текст ошибки для не обработанных баз.
+        :return: Список словарей базы, обработка которых еще продолжается.
+        """
+        self.requeue_expired()
+        for item in self.list_items('pending'):
+            try:
+                os.rename(self.get_path('pending', item), self.get_path('done', item))
+            except FileNotFoundError:
+                # Базу только что взял обработчик
+                continue
+            data = self.read_json(self.get_path('done', item)) or dict()
+            data.update(result=False, error=error_text)
+            self.write_json(self.get_path('done', item), data)
+            warning(u'База <%s> не обработана: %s' % (data.get('base', item), error_text))
+
+        running = list()
+        for item in self.list_items('claimed'):
+            data = self.read_json(self.get_path('claimed', item)) or dict(base=item)
+            lease = self.read_json(self.get_path('claimed', item + QUEUE_LEASE_SUFFIX)) or dict()
+            data.update(result=False, worker=lease.get('worker', u'-'), error=u'Обработка не завершена')
+            running.append(data)
+        return running
+
+    def is_finished(self):
+        """
+        Все базы запуска обработаны?
+        """
+        return not self.list_items('pending') and not self.list_items('claimed')
+
+    def get_results(self):
+        """
+        Результаты обработки баз.
+
+        :return: Список словарей результатов по порядку постановки в очередь.
+        """
+        return [self.read_json(self.get_path('done', item)) or dict(base=item) for item in self.list_items('done')]
+
+    def cleanup(self, keep_run_id):
+        """
+        Удалить папки старых запусков. Сохраняются QUEUE_KEEP_RUNS последних.
+        """
+        run_dirs = sorted([os.path.join(self.queue_dir, dirname) for dirname in os.listdir(self.queue_dir)
+                           if dirname != keep_run_id and os.path.isdir(os.path.join(self.queue_dir, dirname))],
+                          key=os.path.getmtime)
+        for run_dir in run_dirs[:max(0, len(run_dirs) - QUEUE_KEEP_RUNS + 1)]:
+            shutil.rmtree(run_dir, ignore_errors=True)
+
+    @staticmethod
+    def read_json(filename):
+        """
+        Прочитать JSON файл. Отсутствующий или недописанный файл - None.
+        """
+        try:
+            with open(filename, 'rt', encoding='utf-8') as json_file:
+                return json.load(json_file)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def write_json(filename, data):
+        """
+        Записать JSON файл атомарно через временный файл.
+        """
+        tmp_filename = os.path.join(os.path.dirname(filename), '.%s.%s.tmp' % (os.path.basename(filename), uuid.uuid4().hex[:8]))
+        with open(tmp_filename, 'wt', encoding='utf-8') as json_file:
+            json.dump(data, json_file, ensure_ascii=False)
+        os.replace(tmp_filename, filename)
+
+
+class LeaseKeeper(threading.Thread):
+    """
+    Периодическое продление аренды базы на время ее обработки.
+    Если аренда потеряна (истекла и база взята другим обработчиком),
+    то продление прекращается и создание резервной копии отменяется.
+    """
+    def __init__(self, work_queue, item, worker_id, progress=None):
+        threading.Thread.__init__(self, name='LeaseKeeper', daemon=True)
+        self.work_queue = work_queue
+        self.item = item
+        self.worker_id = worker_id
+        self.progress = progress
+        self.stop_event = threading.Event()
+        self.lost = False
+
+    def run(self):
+        while not self.stop_event.wait(QUEUE_LEASE_RENEW):
+            try:
+                if self.work_queue.renew(self.item, self.worker_id):
+                    continue
+            except:
+                fatal(u'Ошибка продления аренды <%s>' % self.item)
+                continue
+            warning(u'Аренда <%s> потеряна обработчиком <%s>. Обработка прекращена' % (self.item, self.worker_id))
+            self.lost = True
+            if self.progress is not None:
+                self.progress.cancel()
+            return
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
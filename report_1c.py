@@ -0,0 +1,693 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Отчет запуска резервного копирования информационных баз 1С:
+текст отчета и результаты по базам (BackupReport), метрики в формате Prometheus,
+формирование письма и отправка отчетов по почте через очередь отправки (outbox).
+
+Письмо формируется потоком во временном файле: прикрепляемые файлы не загружаются в память целиком.
+Отчет сначала ставится в очередь отправки (enqueue_report), а отправляется отдельно (OutboxSender,
+deliver_outbox): не отправленные из-за недоступности SMTP сервера отчеты отправляются следующим запуском.
+"""
+
+import os
+import os.path
+import json
+import uuid
+import threading
+import time
+import shutil
+import tempfile
+import base64
+import zlib
+import email.message
+import email.policy
+import email.utils
+import smtplib
+import datetime
+
+from common_1c import info, warning, fatal
+
+# Отчет по почте
+DEFAULT_SMTP_SERVER_PORT = 25
+DEFAULT_SMTP_TIMEOUT = 60
+# Максимальный размер прикрепляемого к письму файла по умолчанию в байтах
+DEFAULT_ATTACHMENT_MAX_SIZE = 1024 * 1024
+# Размер блока чтения прикрепляемых файлов.
+# Кратен 57 байтам, чтобы каждый блок кодировался в целое число строк base64
+ATTACHMENT_CHUNK_SIZE = 57 * 1024
+# Размер блока передачи письма на SMTP сервер
+SMTP_SEND_CHUNK_SIZE = 64 * 1024
+ATTACHMENT_TRUNCATED_FMT = u'\n\n... Пропущено %d байт ...\n\n'
+
+# Очередь отправки отчетов
+DEFAULT_REPORT_OUTBOX_DIRNAME = 'outbox'
+REPORT_OUTBOX_META_FILENAME = 'report.json'
+REPORT_OUTBOX_TMP_PREFIX = 'tmp-'
+# Максимальное время ожидания отправки отчета по окончании работы в секундах.
+# Не отправленные отчеты остаются в очереди до следующего запуска.
+DEFAULT_REPORT_SEND_TIMEOUT = 300
+# Начальная и максимальная задержки повторной попытки отправки в секундах
+DEFAULT_REPORT_RETRY_DELAY = 5
+DEFAULT_REPORT_MAX_RETRY_DELAY = 120
+REPORT_DIGEST_SUBJECT_FMT = u'%s (+ отложенных отчетов: %d)'
+REPORT_DIGEST_ITEM_FMT = u'=== %s (%s) ===\n%s\n'
+
+# Файл метрик последнего запуска в текстовом формате Prometheus (BackupConfig.metrics_filename),
+# например, для textfile collector node_exporter. Если не определен, то не записывается
+METRICS_PREFIX = 'backup_1c_'
+# Показатели, по которым обнаруживаются отклонения от обычных значений базы:
+# (имя, наименование, направление отклонения: 1 - рост, -1 - снижение, 0 - любое)
+ANOMALY_METRICS = (('size', u'Размер выгрузки', 0),
+                   ('dump_time', u'Длительность выгрузки', 1),
+                   ('upload_rate', u'Скорость копирования', -1))
+
+
+def get_record_metric(record, metric):
+    """
+    Значение показателя записи истории.
+
+    :param record: Запись истории.
+    :param metric: Имя показателя (см. ANOMALY_METRICS).
+    :return: Значение или None, если в записи его нет.
+    """
+    if metric == 'upload_rate':
+        upload_size = record.get('upload_size', None) or record.get('size', None)
+        upload_time = record.get('upload_time', None)
+        return float(upload_size) / upload_time if upload_size and upload_time else None
+    return record.get(metric, None)
+
+
+def get_metrics_label(value):
+    """
+    Значение метки в формате Prometheus.
+    """
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def write_metrics(metrics_filename, backup_results):
+    """
+    Записать метрики запуска в текстовом формате Prometheus.
+    Файл перезаписывается через временный файл, чтобы сборщик не прочитал его частично.
+
+    :param metrics_filename: Полное имя файла метрик.
+    :param backup_results: Список результатов (BackupResult).
+    :return: True/False.
+    """
+    metrics = (('success', 'Backup result (1 - uploaded to all destinations)', lambda result: int(result.result)),
+               ('size_bytes', 'Dump size', lambda result: result.size),
+               ('upload_size_bytes', 'Uploaded (compressed/encrypted) file size', lambda result: result.upload_size),
+               ('dump_seconds', 'Dump duration', lambda result: result.dump_time),
+               ('compress_seconds', 'Compression and encryption duration', lambda result: result.compress_time),
+               ('upload_seconds', 'Upload duration', lambda result: result.upload_time),
+               ('upload_bytes_per_second', 'Upload throughput',
+                lambda result: get_record_metric(dict(upload_size=result.upload_size, size=result.size,
+                                                      upload_time=result.upload_time), 'upload_rate')),
+               ('duration_seconds', 'Total backup duration', lambda result: result.duration))
+    lines = list()
+    for metric, help_txt, get_value in metrics:
+        lines.append('# HELP %s%s %s' % (METRICS_PREFIX, metric, help_txt))
+        lines.append('# TYPE %s%s gauge' % (METRICS_PREFIX, metric))
+        for backup_result in backup_results:
+            value = get_value(backup_result)
+            if value is not None:
+                lines.append('%s%s{base="%s"} %s' % (METRICS_PREFIX, metric, get_metrics_label(backup_result.name), value))
+    lines.append('# HELP %sanomaly Metric deviates from the base baseline (1 - anomaly)' % METRICS_PREFIX)
+    lines.append('# TYPE %sanomaly gauge' % METRICS_PREFIX)
+    for backup_result in backup_results:
+        anomaly_metrics = [anomaly['metric'] for anomaly in backup_result.anomalies]
+        for metric, title, direction in ANOMALY_METRICS:
+            lines.append('%sanomaly{base="%s",metric="%s"} %d' % (METRICS_PREFIX, get_metrics_label(backup_result.name),
+                                                                  metric, metric in anomaly_metrics))
+    lines.append('# HELP %slast_run_timestamp_seconds Time of the last report update' % METRICS_PREFIX)
+    lines.append('# TYPE %slast_run_timestamp_seconds gauge' % METRICS_PREFIX)
+    lines.append('%slast_run_timestamp_seconds %d' % (METRICS_PREFIX, time.time()))
+
+    try:
+        tmp_filename = metrics_filename + '.tmp'
+        with open(tmp_filename, 'wt', encoding='utf-8') as metrics_file:
+            metrics_file.write('\n'.join(lines) + '\n')
+        os.replace(tmp_filename, metrics_filename)
+        return True
+    except:
+        fatal(u'Ошибка записи метрик <%s>' % metrics_filename)
+    return False
+
+
+class BackupReport(object):
+    """
+    Отчет запуска: текст отчета и результаты по базам.
+    Пополняется одновременно из потоков обработки баз.
+    """
+    def __init__(self):
+        """
+        Конструктор.
+        """
+        self.text = ''
+        # Результаты создания резервных копий. Ключ - имя базы, значение - BackupResult
+        self.results = dict()
+        self.lock = threading.Lock()
+
+    def add(self, text):
+        """
+        Добавить строки в отчет.
+
+        :param text: Строки отчета.
+        """
+        with self.lock:
+            self.text += text
+
+    def add_result(self, backup_result, metrics_filename=None):
+        """
+        Добавить результат создания резервной копии в отчет.
+
+        :param backup_result: Результат задания (BackupResult).
+        :param metrics_filename: Файл метрик в формате Prometheus. Если определен, то перезаписывается
+            по всем результатам отчета.
+        """
+        with self.lock:
+            self.text += backup_result.get_report()
+            self.results[backup_result.name] = backup_result
+            if metrics_filename:
+                write_metrics(metrics_filename, list(self.results.values()))
+
+    def get_text(self):
+        """
+        Текст отчета.
+        """
+        with self.lock:
+            return self.text
+
+
+def iter_attachment_chunks(filename, max_size=DEFAULT_ATTACHMENT_MAX_SIZE):
+    """
+    Прочитать прикрепляемый файл блоками.
+    Если файл больше максимального размера, то возвращаются только его начало и конец,
+    а между ними вставляется сообщение о количестве пропущенных байт.
+
+    :param filename: Полное имя прикрепляемого файла.
+    :param max_size: Максимальный размер в байтах. Если не определен, то файл читается полностью.
+    :return: Генератор блоков данных.
+    """
+    file_size = os.stat(filename).st_size
+    with open(filename, 'rb') as file_obj:
+        if not max_size or file_size <= max_size:
+            ranges = ((0, file_size), )
+        else:
+            half_size = int(max_size / 2)
+            ranges = ((0, half_size), (file_size - half_size, half_size))
+
+        for i_range, (offset, size) in enumerate(ranges):
+            if i_range:
+                skipped = file_size - 2 * half_size
+                yield (ATTACHMENT_TRUNCATED_FMT % skipped).encode('utf-8')
+            file_obj.seek(offset)
+            while size > 0:
+                chunk = file_obj.read(min(ATTACHMENT_CHUNK_SIZE, size))
+                if not chunk:
+                    break
+                size -= len(chunk)
+                yield chunk
+
+
+def iter_gzip_chunks(chunks):
+    """
+    Сжать поток блоков данных в формат gzip.
+
+    :param chunks: Итератор исходных блоков данных.
+    :return: Генератор сжатых блоков данных.
+    """
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def iter_base64_lines(chunks):
+    """
+    Закодировать поток блоков данных в base64 строками по 76 символов.
+
+    :param chunks: Итератор исходных блоков данных.
+    :return: Генератор закодированных блоков.
+    """
+    tail = b''
+    for chunk in chunks:
+        data = tail + chunk
+        size = len(data) - len(data) % 57
+        tail = data[size:]
+        if size:
+            yield base64.encodebytes(data[:size]).replace(b'\n', b'\r\n')
+    if tail:
+        yield base64.encodebytes(tail).replace(b'\n', b'\r\n')
+
+
+def get_mime_headers(message):
+    """
+    Получить заголовки части MIME сообщения в виде байтовой строки.
+
+    :param message: Объект email.message.EmailMessage.
+    :return: Байтовая строка заголовков, завершенная пустой строкой.
+    """
+    policy = email.policy.SMTP
+    return b''.join([policy.fold_binary(name, value) for name, value in message.raw_items()]) + b'\r\n'
+
+
+def write_mail_message(msg_file, send_from=None, send_to=(), subject=None, body='', attached=(),
+                       attachment_max_size=DEFAULT_ATTACHMENT_MAX_SIZE, attachment_compress=True):
+    """
+    Записать MIME сообщение письма в файл.
+    Прикрепляемые файлы читаются, сжимаются и кодируются блоками,
+    поэтому расход памяти не зависит от их размера.
+
+    :param msg_file: Открытый на запись в двоичном режиме файловый объект.
+    :param send_from: Адрес с которого отсылается письмо.
+    :param send_to: Список адресов на которые отсылается письмо.
+    :param subject: Тема письма.
+    :param body: Тело письма.
+    :param attached: Список прикрепляемых файлов.
+    :param attachment_max_size: Максимальный размер прикрепляемого файла в байтах.
+    :param attachment_compress: Сжимать прикрепляемые файлы?
+    :return: Размер записанного сообщения в байтах.
+    """
+    boundary = '===============%s==' % uuid.uuid4().hex
+    delimiter = ('--%s\r\n' % boundary).encode('ascii')
+    start_pos = msg_file.tell()
+
+    msg = email.message.EmailMessage(policy=email.policy.SMTP)
+    msg['From'] = str(send_from) if send_from else ''
+    msg['To'] = ', '.join(send_to) if send_to else ''
+    msg['Date'] = email.utils.formatdate(localtime=True)
+    msg['Subject'] = str(subject) if subject else ''
+    msg['MIME-Version'] = '1.0'
+    msg['Content-Type'] = 'multipart/mixed; boundary="%s"' % boundary
+    msg_file.write(get_mime_headers(msg))
+
+    body_part = email.message.EmailMessage(policy=email.policy.SMTP)
+    body_part.set_content(body, cte='base64')
+    del body_part['MIME-Version']
+    msg_file.write(delimiter)
+    msg_file.write(body_part.as_bytes())
+
+    # Прикрепление файлов
+    for filename in attached:
+        if not os.path.exists(filename):
+            warning(u'Attached file <%s> not found' % filename)
+            continue
+
+        attachment_name = os.path.basename(filename)
+        chunks = iter_attachment_chunks(filename, max_size=attachment_max_size)
+        part = email.message.EmailMessage(policy=email.policy.SMTP)
+        if attachment_compress:
+            attachment_name += '.gz'
+            chunks = iter_gzip_chunks(chunks)
+            part['Content-Type'] = 'application/gzip'
+        elif attachment_name.endswith('.gz'):
+            part['Content-Type'] = 'application/gzip'
+        else:
+            part['Content-Type'] = 'application/octet-stream'
+        part['Content-Transfer-Encoding'] = 'base64'
+        part.add_header('Content-Disposition', 'attachment', filename=attachment_name)
+
+        msg_file.write(b'\r\n' + delimiter)
+        msg_file.write(get_mime_headers(part))
+        for block in iter_base64_lines(chunks):
+            msg_file.write(block)
+
+        file_size = os.stat(filename).st_size
+        info(u'File <%s> (%s) attached to email' % (filename, file_size))
+
+    msg_file.write(('\r\n--%s--\r\n' % boundary).encode('ascii'))
+    return msg_file.tell() - start_pos
+
+
+def connect_smtp(smtp_server=None, smtp_server_port=None, login=None, password=None,
+                 timeout=DEFAULT_SMTP_TIMEOUT):
+    """
+    Установить соединение с SMTP сервером.
+
+    :param smtp_server: SMTP сервер.
+    :param smtp_server_port: Порт SMTP сервера, обычно 25.
+    :param login: Логин на SMTP сервере.
+    :param password: Пароль на SMTP сервере.
+    :param timeout: Таймаут операций с сервером в секундах.
+    :return: Объект smtplib.SMTP.
+    """
+    smtp = smtplib.SMTP(smtp_server, smtp_server_port, timeout=timeout)
+    try:
+        smtp.set_debuglevel(0)
+        if login:
+            smtp.login(login, password)
+        smtp.ehlo_or_helo_if_needed()
+    except:
+        smtp.close()
+        raise
+    return smtp
+
+
+def send_mail_file(msg_file, send_from=None, send_to=(),
+                   smtp_server=None, smtp_server_port=None,
+                   login=None, password=None, smtp=None):
+    """
+    Отправить на SMTP сервер письмо, сохраненное в файле.
+    Сообщение передается блоками, целиком в память не загружается.
+
+    :param msg_file: Открытый на чтение в двоичном режиме файловый объект сообщения.
+    :param send_from: Адрес с которого отсылается письмо.
+    :param send_to: Список адресов на которые отсылается письмо.
+    :param smtp_server: SMTP сервер.
+    :param smtp_server_port: Порт SMTP сервера, обычно 25.
+    :param login: Логин на SMTP сервере.
+    :param password: Пароль на SMTP сервере.
+    :param smtp: Уже установленное соединение с SMTP сервером.
+        Если определено, то соединение не закрывается после отправки.
+    """
+    connected = smtp is None
+    if connected:
+        smtp = connect_smtp(smtp_server, smtp_server_port, login=login, password=password)
+    try:
+        code, response = smtp.mail(send_from or '')
+        if code != 250:
+            raise smtplib.SMTPSenderRefused(code, response, send_from)
+        refused = dict()
+        for address in send_to:
+            code, response = smtp.rcpt(address)
+            if code not in (250, 251):
+                refused[address] = (code, response)
+        if len(refused) == len(send_to):
+            raise smtplib.SMTPRecipientsRefused(refused)
+
+        code, response = smtp.docmd('data')
+        if code != 354:
+            raise smtplib.SMTPDataError(code, response)
+        # Строки, начинающиеся с точки, экранируются (RFC 5321, 4.5.2)
+        buffer = list()
+        buffer_size = 0
+        for line in msg_file:
+            if line.startswith(b'.'):
+                line = b'.' + line
+            buffer.append(line)
+            buffer_size += len(line)
+            if buffer_size >= SMTP_SEND_CHUNK_SIZE:
+                smtp.send(b''.join(buffer))
+                buffer = list()
+                buffer_size = 0
+        if not buffer or not buffer[-1].endswith(b'\r\n'):
+            buffer.append(b'\r\n')
+        buffer.append(b'.\r\n')
+        smtp.send(b''.join(buffer))
+        code, response = smtp.getreply()
+        if code != 250:
+            raise smtplib.SMTPDataError(code, response)
+
+        if refused:
+            warning(u'Email recipients refused: %s' % str(refused))
+        if connected:
+            smtp.quit()
+    finally:
+        if connected:
+            smtp.close()
+
+
+def prepare_attachment_file(filename, dst_dirname, max_size=DEFAULT_ATTACHMENT_MAX_SIZE, compress=True):
+    """
+    Подготовить копию прикрепляемого файла для очереди отправки.
+    Копия сжимается и ограничивается по размеру так же, как при отправке письма.
+
+    :param filename: Полное имя прикрепляемого файла.
+    :param dst_dirname: Папка для сохранения копии.
+    :param max_size: Максимальный размер в байтах.
+    :param compress: Сжимать файл (gzip)?
+    :return: Полное имя подготовленной копии или None в случае ошибки.
+    """
+    if not os.path.exists(filename):
+        warning(u'Attached file <%s> not found' % filename)
+        return None
+
+    chunks = iter_attachment_chunks(filename, max_size=max_size)
+    dst_filename = os.path.join(dst_dirname, os.path.basename(filename))
+    if compress:
+        chunks = iter_gzip_chunks(chunks)
+        dst_filename += '.gz'
+    with open(dst_filename, 'wb') as dst_file:
+        for chunk in chunks:
+            dst_file.write(chunk)
+    return dst_filename
+
+
+def enqueue_report(outbox_dir, send_from=None, send_to=(), subject=None, body='', attached=(),
+                   attachment_max_size=DEFAULT_ATTACHMENT_MAX_SIZE, attachment_compress=True):
+    """
+    Поставить отчет в очередь отправки.
+    Каждый отчет хранится в отдельной папке очереди: описание письма в JSON файле
+    и подготовленные копии прикрепляемых файлов.
+    Папка сначала создается под временным именем, а затем переименовывается,
+    поэтому отправитель никогда не видит не до конца записанный отчет.
+
+    :param outbox_dir: Папка очереди отправки.
+    :param send_from: Адрес с которого отсылается письмо.
+    :param send_to: Список адресов на которые отсылается письмо.
+    :param subject: Тема письма.
+    :param body: Тело письма.
+    :param attached: Список прикрепляемых файлов.
+    :param attachment_max_size: Максимальный размер прикрепляемого файла в байтах.
+    :param attachment_compress: Сжимать прикрепляемые файлы?
+    :return: Полное имя папки отчета в очереди или None в случае ошибки.
+    """
+    try:
+        if not os.path.exists(outbox_dir):
+            os.makedirs(outbox_dir)
+
+        report_id = '%s-%s' % (datetime.datetime.now().strftime('%Y%m%d%H%M%S%f'), uuid.uuid4().hex[:8])
+        tmp_dirname = os.path.join(outbox_dir, REPORT_OUTBOX_TMP_PREFIX + report_id)
+        os.makedirs(tmp_dirname)
+
+        attachments = list()
+        for filename in attached:
+            dst_filename = prepare_attachment_file(filename, tmp_dirname,
+                                                   max_size=attachment_max_size, compress=attachment_compress)
+            if dst_filename:
+                attachments.append(os.path.basename(dst_filename))
+
+        meta = dict(send_from=send_from, send_to=list(send_to or ()),
+                    subject=subject or '', body=body or '',
+                    attached=attachments,
+                    created=datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+        with open(os.path.join(tmp_dirname, REPORT_OUTBOX_META_FILENAME), 'wt', encoding='utf-8') as meta_file:
+            json.dump(meta, meta_file, ensure_ascii=False, indent=1)
+
+        report_dirname = os.path.join(outbox_dir, report_id)
+        os.rename(tmp_dirname, report_dirname)
+        info(u'Отчет <%s> поставлен в очередь отправки <%s>' % (subject, outbox_dir))
+        return report_dirname
+    except:
+        fatal(u'Ошибка постановки отчета в очередь отправки <%s>' % outbox_dir)
+    return None
+
+
+def get_outbox_reports(outbox_dir):
+    """
+    Получить список отчетов, ожидающих отправки.
+
+    :param outbox_dir: Папка очереди отправки.
+    :return: Список кортежей (папка отчета, словарь описания отчета) в порядке постановки в очередь.
+    """
+    reports = list()
+    if not os.path.isdir(outbox_dir):
+        return reports
+
+    for report_id in sorted(os.listdir(outbox_dir)):
+        report_dirname = os.path.join(outbox_dir, report_id)
+        meta_filename = os.path.join(report_dirname, REPORT_OUTBOX_META_FILENAME)
+        if report_id.startswith(REPORT_OUTBOX_TMP_PREFIX) or not os.path.exists(meta_filename):
+            continue
+        try:
+            with open(meta_filename, 'rt', encoding='utf-8') as meta_file:
+                reports.append((report_dirname, json.load(meta_file)))
+        except:
+            fatal(u'Ошибка чтения отчета <%s> из очереди отправки' % report_dirname)
+    return reports
+
+
+def deliver_outbox(outbox_dir, smtp_server=None, smtp_server_port=None, login=None, password=None):
+    """
+    Отправить отчеты, ожидающие в очереди.
+    Отчеты одних и тех же отправителя и получателей объединяются в одно сводное письмо.
+    Все письма отправляются через одно соединение с SMTP сервером.
+    Успешно отправленные отчеты удаляются из очереди.
+
+    :param outbox_dir: Папка очереди отправки.
+    :param smtp_server: SMTP сервер.
+    :param smtp_server_port: Порт SMTP сервера, обычно 25.
+    :param login: Логин на SMTP сервере.
+    :param password: Пароль на SMTP сервере.
+    :return: True - очередь пуста / False - остались не отправленные отчеты.
+    """
+    reports = get_outbox_reports(outbox_dir)
+    if not reports:
+        return True
+
+    groups = dict()
+    for report_dirname, meta in reports:
+        key = (meta.get('send_from', None), tuple(meta.get('send_to', ())))
+        groups.setdefault(key, list()).append((report_dirname, meta))
+
+    smtp = None
+    try:
+        smtp = connect_smtp(smtp_server, smtp_server_port, login=login, password=password)
+        for (send_from, send_to), group in groups.items():
+            last_meta = group[-1][1]
+            if len(group) == 1:
+                subject = last_meta.get('subject', '')
+                body = last_meta.get('body', '')
+            else:
+                subject = REPORT_DIGEST_SUBJECT_FMT % (last_meta.get('subject', ''), len(group) - 1)
+                body = u'\n'.join([REPORT_DIGEST_ITEM_FMT % (meta.get('subject', ''), meta.get('created', ''), meta.get('body', ''))
+                                   for report_dirname, meta in group])
+            attached = [os.path.join(report_dirname, filename)
+                        for report_dirname, meta in group for filename in meta.get('attached', ())]
+
+            with tempfile.TemporaryFile() as msg_file:
+                write_mail_message(msg_file, send_from=send_from, send_to=send_to,
+                                   subject=subject, body=body, attached=attached,
+                                   attachment_max_size=None, attachment_compress=False)
+                msg_file.seek(0)
+                send_mail_file(msg_file, send_from=send_from, send_to=send_to, smtp=smtp)
+            info(u'Email from <%s> to %s sended. Reports: %d' % (send_from, send_to, len(group)))
+
+            for report_dirname, meta in group:
+                shutil.rmtree(report_dirname, ignore_errors=True)
+        smtp.quit()
+    except (smtplib.SMTPException, OSError) as exception:
+        warning(u'Error send email from outbox <%s>: %s' % (outbox_dir, exception))
+    finally:
+        if smtp:
+            smtp.close()
+    return not get_outbox_reports(outbox_dir)
+
+
+class OutboxSender(threading.Thread):
+    """
+    Фоновая отправка отчетов из очереди.
+    При ошибке отправки попытки повторяются с экспоненциально растущей задержкой.
+    """
+    def __init__(self, outbox_dir, smtp_server=None, smtp_server_port=None, login=None, password=None,
+                 retry_delay=DEFAULT_REPORT_RETRY_DELAY, max_retry_delay=DEFAULT_REPORT_MAX_RETRY_DELAY):
+        """
+        Конструктор.
+
+        :param outbox_dir: Папка очереди отправки.
+        :param smtp_server: SMTP сервер.
+        :param smtp_server_port: Порт SMTP сервера, обычно 25.
+        :param login: Логин на SMTP сервере.
+        :param password: Пароль на SMTP сервере.
+        :param retry_delay: Начальная задержка повторной попытки в секундах.
+        :param max_retry_delay: Максимальная задержка повторной попытки в секундах.
+        """
+        threading.Thread.__init__(self, name='OutboxSender', daemon=True)
+        self.outbox_dir = outbox_dir
+        self.smtp_server = smtp_server
+        self.smtp_server_port = smtp_server_port
+        self.login = login
+        self.password = password
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+
+        self.wakeup = threading.Event()
+        self.deadline = None
+        self.delivered = False
+
+    def run(self):
+        """
+        Цикл отправки.
+        """
+        delay = self.retry_delay
+        while True:
+            finishing = self.deadline is not None
+            self.wakeup.clear()
+            self.delivered = deliver_outbox(self.outbox_dir,
+                                            smtp_server=self.smtp_server, smtp_server_port=self.smtp_server_port,
+                                            login=self.login, password=self.password)
+            if self.delivered:
+                if finishing:
+                    return
+                delay = self.retry_delay
+                timeout = None
+            else:
+                timeout = delay
+                delay = min(delay * 2, self.max_retry_delay)
+
+            if self.deadline is not None:
+                remaining = self.deadline - time.time()
+                if remaining <= 0:
+                    return
+                timeout = remaining if timeout is None else min(timeout, remaining)
+            self.wakeup.wait(timeout)
+
+    def notify(self):
+        """
+        Сообщить о появлении новых отчетов в очереди.
+        """
+        self.wakeup.set()
+
+    def finish(self, timeout=DEFAULT_REPORT_SEND_TIMEOUT):
+        """
+        Отправить оставшиеся отчеты и завершить отправку.
+
+        :param timeout: Максимальное время ожидания отправки в секундах.
+        :return: True - все отчеты отправлены / False - в очереди остались не отправленные отчеты.
+        """
+        self.deadline = time.time() + timeout
+        self.notify()
+        self.join(timeout)
+        return self.delivered and not self.is_alive()
+
+
+def send_mail(send_from=None, send_to=(),
+              subject=None, body=None, attached=(),
+              smtp_server=None, smtp_server_port=None,
+              login=None, password=None,
+              attachment_max_size=DEFAULT_ATTACHMENT_MAX_SIZE, attachment_compress=True):
+    """
+    Функция отправки письма.
+
+    :param send_from: Адрес с которого отсылается письмо.
+    :param send_to: Список адресов на которые отсылается письмо.
+    :param subject: Тема письма.
+    :param body: Тело письма.
+    :param attached: Список прикрепляемых файлов.
+    :param smtp_server: SMTP сервер.
+    :param smtp_server_port: Порт SMTP сервера, обычно 25.
+    :param login: Логин на SMTP сервере.
+    :param password: Пароль на SMTP сервере.
+    :param attachment_max_size: Максимальный размер прикрепляемого файла в байтах.
+        Из файла большего размера в письмо попадают только начало и конец.
+    :param attachment_compress: Сжимать прикрепляемые файлы (gzip)?
+    :return: True/False.
+    """
+    # Проверка типов входных аргументов
+    assert isinstance(send_to, (list, tuple))
+    assert isinstance(attached, (list, tuple))
+    assert isinstance(body, str)
+
+    # Сообщение формируется во временном файле
+    with tempfile.TemporaryFile() as msg_file:
+        msg_size = write_mail_message(msg_file, send_from=send_from, send_to=send_to,
+                                      subject=subject, body=body, attached=attached,
+                                      attachment_max_size=attachment_max_size,
+                                      attachment_compress=attachment_compress)
+        msg_file.seek(0)
+        info(u'Email message size: %s' % msg_size)
+
+        # Соединение с SMTP сервером и отправка сообщения
+        try:
+            send_mail_file(msg_file, send_from=send_from, send_to=send_to,
+                           smtp_server=smtp_server, smtp_server_port=smtp_server_port,
+                           login=login, password=password)
+            info(u'Email from <%s> to %s sended' % (send_from, send_to))
+            return True
+        except (smtplib.SMTPException, OSError):
+            fatal(u'Error send email')
+    return False
@@ -32,6 +32,9 @@ sudo apt install python3-dialog
         --help|-h|-?        Помощь
         --version|-v        Версия программы
         --debug|-d          Включить сообщения отладки
+        --log_format=       Формат журнала: console - цветной текст, json - JSON строки
+                            Если не указывается, то берется из файла настроек (log_format),
+                            иначе console при выводе на терминал и json при перенаправлении вывода
 
     [Основные опции]
         --settings=         Явное указание файла настроек.
@@ -47,139 +50,46 @@ sudo apt install python3-dialog
         --password=         Пароль администратора 1С
         --on                Вкл. блокировку запуска регламентных заданий информационной базы 1С
         --off               Откл. блокировку запуска регламентных заданий информационной базы 1С
+        --wait              После вкл. блокировки ожидать завершения уже запущенных фоновых заданий
+        --wait_timeout=     Максимальное время ожидания завершения фоновых заданий одной базы в секундах
+                            Если не указывается, то берется из настроек базы (background_jobs_timeout) или 3600.
+        --workers=          Количество одновременно обрабатываемых информационных баз 1С
+                            Если не указывается, то берется из файла настроек (scheduled_jobs_workers) или 16.
 """
 
 import sys
 import getopt
-import locale
 import os
 import os.path
-import traceback
-import subprocess
 import time
-
-try:
-    import configparser
-except ImportError:
-    print('Import error configparser')
+import concurrent.futures
 
 try:
     import dialog
 except ImportError:
     print('Import error pythondialog. Install: sudo apt install python3-dialog')
 
-__version__ = (0, 0, 1, 1)
-
-# Режим отладки
-DEBUG_MODE = False
-
-# Имя INI файла настроек
-SETTINGS_INI_FILENAME = './settings.ini'
-
-# Кодировка командной оболочки по умолчанию
-DEFAULT_ENCODING = sys.stdout.encoding if sys.platform.startswith('win') else locale.getpreferredencoding()
-
-# Цвета в консоли
-RED_COLOR_TEXT = '\x1b[31;1m'       # red
-GREEN_COLOR_TEXT = '\x1b[32m'       # green
-YELLOW_COLOR_TEXT = '\x1b[33;1m'    # yellow
-BLUE_COLOR_TEXT = '\x1b[34m'        # blue
-PURPLE_COLOR_TEXT = '\x1b[35m'      # purple
-CYAN_COLOR_TEXT = '\x1b[36m'        # cyan
-WHITE_COLOR_TEXT = '\x1b[37m'       # white
-NORMAL_COLOR_TEXT = '\x1b[0m'       # normal
-
-
-GET_1C_CLUSTERS_CMD_FMT = '%s cluster list %s:%s'
-GET_1C_INFOBASES_CMD_FMT = '%s infobase --cluster=%s summary list %s:%s'
-SET_1C_SCHEDULED_JOBS_CMD_FMT = '%s infobase --cluster=%s update --infobase=%s --infobase-user=%s --infobase-pwd=%s --scheduled-jobs-deny=%s %s:%s'
-DT_FILENAME_1C_FMT = '-%Y-%m-%d-%H-%M-%S.dt'
-ADMIN_1C_NAME = u'Администратор'
-ADMIN_1C_PASSWORD = '123123'
-SYSTEM_TIME_SLEEP = 3
-
-DEFAULT_ROOT_PASSWORD = '123456'
-
-
-def get_default_encoding():
-    """
-    Определить актуальную кодировку для вывода текста.
-
-    :return: Актуальная кодировка для вывода текста.
-    """
-    return DEFAULT_ENCODING
-
-
-def print_color_txt(txt, color=NORMAL_COLOR_TEXT):
-    """
-    Печать цветного текста.
-
-    :param txt: Текст.
-    :param color: Консольный цвет.
-    """
-    if sys.platform.startswith('win'):
-        # Для Windows систем цветовая раскраска отключена
-        txt = txt
-    else:
-        # Добавление цветовой раскраски
-        txt = color + txt + NORMAL_COLOR_TEXT
-    print(txt)
-
-
-def debug(message=u''):
-    """
-    Вывести ОТЛАДОЧНУЮ информацию.
-
-    :param message: Текстовое сообщение.
-    """
-    print_color_txt('DEBUG. ' + message, BLUE_COLOR_TEXT)
-
-
-def info(message=u''):
-    """
-    Вывести ТЕКСТОВУЮ информацию.
-
-    :param message: Текстовое сообщение.
-    """
-    print_color_txt(message, GREEN_COLOR_TEXT)
-
+import common_1c
+from common_1c import (RED_COLOR_TEXT, GREEN_COLOR_TEXT, ADMIN_1C_NAME, ADMIN_1C_PASSWORD,
+                       BACKGROUND_JOB_APP_ID, print_color_txt, log_context, info, error, warning, fatal,
+                       ini2dict, get_cluster_client)
 
-def error(message=u''):
-    """
-    Вывести информацию ОБ ОШИБКЕ.
-
-    :param message: Текстовое сообщение.
-    """
-    print_color_txt('ERROR. ' + message, RED_COLOR_TEXT)
-
-
-def warning(message=u''):
-    """
-    Вывести информацию ОБ ПРЕДУПРЕЖДЕНИИ.
-
-    :param message: Текстовое сообщение.
-    """
-    print_color_txt('WARNING. ' + message, YELLOW_COLOR_TEXT)
-
-
-def fatal(message=u''):
-    """
-    Вывести информацию ОБ ОШИБКЕ.
+__version__ = (0, 0, 1, 1)
 
-    :param message: Текстовое сообщение.
-    """
-    trace_txt = traceback.format_exc()
+# Имя INI файла настроек по умолчанию
+DEFAULT_SETTINGS_INI_FILENAME = './settings.ini'
 
-    try:
-        msg = message + u'\n' + trace_txt
-    except UnicodeDecodeError:
-        if not isinstance(message, str):
-            message = str(message)
-        if not isinstance(trace_txt, str):
-            trace_txt = str(trace_txt)
-        msg = message + u'\n' + trace_txt
+# Количество одновременно обрабатываемых информационных баз 1С по умолчанию
+DEFAULT_WORKERS = 16
+# Проверка установленного режима блокировки регламентных заданий:
+# количество попыток чтения и задержка между ними
+VERIFY_ATTEMPTS = 5
+VERIFY_TIME_SLEEP = 0.5
 
-    print_color_txt('FATAL. ' + msg, RED_COLOR_TEXT)
+# Максимальное время ожидания завершения фоновых заданий одной базы в секундах
+DEFAULT_BACKGROUND_JOBS_TIMEOUT = 3600
+# Период опроса сеансов фоновых заданий в секундах
+BACKGROUND_JOBS_TIME_SLEEP = 10
 
 
 def main(*argv):
@@ -189,9 +99,7 @@ def main(*argv):
     :param argv: Параметры командной строки.
     :return:
     """
-    global DEBUG_MODE
-    global SETTINGS_INI_FILENAME
-
+    settings_filename = DEFAULT_SETTINGS_INI_FILENAME
     host = None
     port = None
     name = None
@@ -199,225 +107,224 @@ def main(*argv):
     admin = None
     password = None
     on_or_off = False
+    wait = False
+    wait_timeout = None
+    workers = None
 
     try:
         options, args = getopt.getopt(argv, 'h?vd',
-                                      ['help', 'version', 'debug',
+                                      ['help', 'version', 'debug', 'log_format=',
                                        'settings=',
                                        'host=', 'port=', 'name=', 'path_1c=',
                                        'admin=', 'password=',
                                        'on', 'off',
+                                       'wait', 'wait_timeout=',
+                                       'workers=',
                                        ])
     except getopt.error as msg:
-        error(str(msg))
-        info(__doc__)
+        print_color_txt(str(msg), RED_COLOR_TEXT)
+        print_color_txt(__doc__, GREEN_COLOR_TEXT)
         sys.exit(2)
 
     for option, arg in options:
         if option in ('-h', '--help', '-?'):
-            info(__doc__)
+            print_color_txt(__doc__, GREEN_COLOR_TEXT)
             sys.exit(0)
         elif option in ('-v', '--version'):
             str_version = 'Версия: %s' % '.'.join([str(sign) for sign in __version__])
-            info(str_version)
+            print_color_txt(str_version, GREEN_COLOR_TEXT)
             sys.exit(0)
         elif option in ('-d', '--debug'):
-            DEBUG_MODE = True
+            common_1c.DEBUG_MODE = True
             info(u'Включен режим отладки')
+        elif option == '--log_format':
+            common_1c.LOG_FORMAT = arg
         elif option == '--settings':
-            SETTINGS_INI_FILENAME = arg
-            if DEBUG_MODE:
-                info(u'Файл настроек <%s>' % SETTINGS_INI_FILENAME)
+            settings_filename = arg
+            info(u'Файл настроек <%s>' % settings_filename)
 
         elif option == '--host':
             host = arg
-            if DEBUG_MODE:
-                info(u'\tHost: %s' % host)
+            info(u'\tHost: %s' % host)
         elif option == '--port':
             port = arg
-            if DEBUG_MODE:
-                info(u'\tPort: %s' % port)
+            info(u'\tPort: %s' % port)
         elif option == '--name':
             name = arg
-            if DEBUG_MODE:
-                info(u'\tName: %s' % name)
+            info(u'\tName: %s' % name)
         elif option == '--path_1c':
             path_1c = arg
-            if DEBUG_MODE:
-                info(u'\tPath 1C: %s' % path_1c)
+            info(u'\tPath 1C: %s' % path_1c)
         elif option == '--admin':
             admin = arg
-            if DEBUG_MODE:
-                info(u'\tAdministrator 1C: %s' % admin)
+            info(u'\tAdministrator 1C: %s' % admin)
         elif option == '--password':
             password = arg
-            if DEBUG_MODE:
-                info(u'\tAdministrator 1C password: %s' % password)
+            info(u'\tAdministrator 1C password: %s' % password)
         elif option == '--on':
             on_or_off = True
             info(u'Включена блокировка запуска регламентных заданий')
         elif option == '--off':
             on_or_off = False
             info(u'Отключена блокировка запуска регламентных заданий')
+        elif option == '--wait':
+            wait = True
+            info(u'Включено ожидание завершения фоновых заданий')
+        elif option == '--wait_timeout':
+            wait_timeout = int(arg)
+            info(u'\tWait timeout: %s' % wait_timeout)
+        elif option == '--workers':
+            workers = int(arg)
+            info(u'\tWorkers: %s' % workers)
 
         else:
-            if DEBUG_MODE:
-                msg = u'Не поддерживаемый параметр командной строки <%s>' % option
-                warning(msg)
+            msg = u'Не поддерживаемый параметр командной строки <%s>' % option
+            warning(msg)
 
     try:
         if host and port and name and path_1c and admin and password:
-            if DEBUG_MODE:
-                info(u'Все параметры вкл/откл запуска регламентных заданий информационной базы 1С заданы явно')
+            info(u'Все параметры вкл/откл запуска регламентных заданий информационной базы 1С заданы явно')
             set_scheduled_jobs_1c_infobase(host=host,
                                            port=port,
                                            name=name,
                                            path_1c=path_1c,
                                            admin=admin,
                                            password=password,
-                                           on_or_off=on_or_off)
+                                           on_or_off=on_or_off,
+                                           wait=wait,
+                                           wait_timeout=wait_timeout if wait_timeout is not None else DEFAULT_BACKGROUND_JOBS_TIMEOUT)
         else:
-            run(settings_filename=SETTINGS_INI_FILENAME, on_or_off=on_or_off)
+            run(settings_filename=settings_filename, on_or_off=on_or_off, workers=workers,
+                wait=wait, wait_timeout=wait_timeout)
     except:
-        if DEBUG_MODE:
-            fatal(u'Ошибка выполнения:')
+        fatal(u'Ошибка выполнения:')
 
 
-def run(settings_filename=None, on_or_off=False):
+def run(settings_filename=None, on_or_off=False, workers=None, wait=False, wait_timeout=None):
     """
     Основная исполняемая процедура.
 
     :param settings_filename: Имя INI файла настроек.
         Если не определен, то берется по умолчанию.
     :param on_or_off: True - вкл блокировка регламентных заданий, False - откл блокировки регламентных заданий.
+    :param workers: Количество одновременно обрабатываемых информационных баз 1С.
+        Если не определено, то берется из файла настроек.
+    :param wait: Ожидать завершения уже запущенных фоновых заданий?
+    :param wait_timeout: Максимальное время ожидания завершения фоновых заданий одной базы в секундах.
+        Если не определено, то берется из настроек базы.
     :return: True/False.
     """
-    global DEBUG_MODE
-    global SETTINGS_INI_FILENAME
-
     if settings_filename is None:
-        settings_filename = SETTINGS_INI_FILENAME
+        settings_filename = DEFAULT_SETTINGS_INI_FILENAME
 
     if not os.path.exists(settings_filename):
-        if DEBUG_MODE:
-            error(u'Файл настроек <%s> не найден' % settings_filename)
+        error(u'Файл настроек <%s> не найден' % settings_filename)
         return False
 
     # Прочитали настройки
     settings = ini2dict(ini_filename=settings_filename)
 
+    if common_1c.LOG_FORMAT is None and settings:
+        common_1c.LOG_FORMAT = settings.get('SETTINGS', dict()).get('log_format', None)
+
     try:
-        results = True
         bases = settings.get('SETTINGS', dict()).get('bases', list())
         if bases:
+            if workers is None:
+                workers = settings.get('SETTINGS', dict()).get('scheduled_jobs_workers', DEFAULT_WORKERS)
+            base_settings = dict()
             for base_name in bases:
-                if DEBUG_MODE:
-                    info(u'Параметры вкл/откл регламентных заданий информационной базы 1С <%s> загружены их файла <%s>' % (base_name, settings_filename))
-                base = settings.get(base_name, dict())
-                host = base.get('host', None)
-                port = base.get('port', None)
-                name = base.get('name', None)
-                path_1c = base.get('path_1c', None)
-                admin = base.get('admin', ADMIN_1C_NAME)
-                password = base.get('password', ADMIN_1C_PASSWORD)
-                result = set_scheduled_jobs_1c_infobase(host=host,
-                                                        port=port,
-                                                        name=name,
-                                                        path_1c=path_1c,
-                                                        admin=admin,
-                                                        password=password,
-                                                        on_or_off=on_or_off)
-                results = results and result
+                info(u'Параметры вкл/откл регламентных заданий информационной базы 1С <%s> загружены их файла <%s>' % (base_name, settings_filename))
+                base_settings[base_name] = settings.get(base_name, dict())
+            results = set_scheduled_jobs_1c_infobases(bases=base_settings, on_or_off=on_or_off, workers=workers,
+                                                      wait=wait, wait_timeout=wait_timeout)
+            return all(results.values())
         else:
             warning(u'Не определен список обрабатываемых баз 1С')
-            results = False
-
-        return results
     except:
         fatal(u'Ошибка вкл/откл регламентных заданий информационных баз 1С')
 
     return False
 
 
-def ini2dict(ini_filename, encoding=DEFAULT_ENCODING):
+def set_scheduled_jobs_1c_infobases(bases, on_or_off=False, workers=DEFAULT_WORKERS, wait=False, wait_timeout=None):
     """
-    Загрузить INI файл как словарь.
+    Вкл/откл регламентных заданий нескольких информационных баз 1С одновременно.
+    Базы одного сервера обрабатываются одним клиентом кластера,
+    поэтому список информационных баз сервера запрашивается один раз.
 
-    :param ini_filename: Полное имя INI файла настроек.
-    :return: Словарь настроек или None в случае ошибки.
+    :param bases: Словарь настроек информационных баз 1С.
+        Ключ - имя секции в файле настроек, значение - словарь параметров базы.
+    :param on_or_off: True - вкл блокировка регламентных заданий, False - откл блокировки регламентных заданий.
+    :param workers: Количество одновременно обрабатываемых информационных баз 1С.
+    :param wait: Ожидать завершения уже запущенных фоновых заданий?
+    :param wait_timeout: Максимальное время ожидания завершения фоновых заданий одной базы в секундах.
+        Если не определено, то берется из настроек базы (background_jobs_timeout).
+    :return: Словарь результатов. Ключ - имя секции в файле настроек, значение - True/False.
     """
-    global DEBUG_MODE
+    start_time = time.time()
+    results = dict()
+    if not bases:
+        return results
 
-    ini_file = None
-    try:
-        if not os.path.exists(ini_filename):
-            if DEBUG_MODE:
-                warning(u'INI файл <%s> не найден' % ini_filename)
-            return None
-
-        ini_parser = configparser.ConfigParser()
-        ini_file = open(ini_filename, 'rt', encoding=encoding)
-        ini_parser.read_file(ini_file)
-        ini_file.close()
-
-        ini_dict = {}
-        sections = ini_parser.sections()
-        for section in sections:
-            params = ini_parser.options(section)
-            ini_dict[section] = {}
-            for param in params:
-                param_str = ini_parser.get(section, param)
-                try:
-                    # Perhaps in the form of a parameter is recorded a dictionary / list / None / number, etc.
-                    param_value = eval(param_str)
-                except:
-                    # No, it's a string.
-                    param_value = param_str
-
-                if DEBUG_MODE:
-                    debug(u'\t%s.%s = %s' % (section, param, param_value))
-
-                ini_dict[section][param] = param_value
-
-        return ini_dict
-    except:
-        if ini_file:
-            ini_file.close()
-        if DEBUG_MODE:
-            fatal(u'Error converting INI file <%s> to dictionary' % ini_filename)
-    return None
+    clients = dict()
+    workers = max(1, min(int(workers or 1), len(bases)))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = dict()
+        for base_name, base in bases.items():
+            future = executor.submit(set_scheduled_jobs_1c_infobase_task,
+                                     base_name,
+                                     host=base.get('host', None),
+                                     port=base.get('port', None),
+                                     name=base.get('name', None),
+                                     path_1c=base.get('path_1c', None),
+                                     admin=base.get('admin', ADMIN_1C_NAME),
+                                     password=base.get('password', ADMIN_1C_PASSWORD),
+                                     on_or_off=on_or_off,
+                                     wait=wait,
+                                     wait_timeout=wait_timeout if wait_timeout is not None else base.get('background_jobs_timeout', DEFAULT_BACKGROUND_JOBS_TIMEOUT),
+                                     client=get_cluster_client(base.get('path_1c', None) or '', base.get('host', None),
+                                                               base.get('port', None), clients=clients,
+                                                               transport=base.get('cluster_transport', None)))
+            futures[future] = base_name
+
+        for future in concurrent.futures.as_completed(futures):
+            base_name = futures[future]
+            try:
+                results[base_name] = future.result()
+            except:
+                fatal(u'Ошибка вкл/откл регламентных заданий информационной базы 1С <%s>' % base_name)
+                results[base_name] = False
+
+    for base_name in bases:
+        if results.get(base_name):
+            info(u'\t%s - Да' % base_name)
+        else:
+            error(u'\t%s - НЕТ' % base_name)
+    info(u'Вкл/откл регламентных заданий информационных баз 1С [%d] ... %s' % (len(bases), time.time() - start_time))
+    return results
 
 
-def get_lines_exec_cmd(cmd):
+def set_scheduled_jobs_1c_infobase_task(base_name, *args, **kwargs):
     """
-    Получить строки - результат выполнения команды системы.
+    Вкл/откл регламентных заданий информационной базы 1С в отдельном потоке.
+    Записи журнала помечаются именем обрабатываемой базы.
 
-    :param cmd: Комманда ОС.
-    :return: Список строк или пустой список в случае ошибки.
+    :param base_name: Имя секции базы в файле настроек.
+    :return: Результат set_scheduled_jobs_1c_infobase.
     """
-    global DEBUG_MODE
-
-    lines = list()
-    try:
-        if DEBUG_MODE:
-            info(u'Выполнение команды <%s>' % cmd)
-
-        cmd_list = cmd.split(' ')
-        process = subprocess.Popen(cmd_list, stdout=subprocess.PIPE)
-        b_lines = process.stdout.readlines()
-        console_encoding = locale.getpreferredencoding()
-        lines = [line.decode(console_encoding).strip() for line in b_lines]
-    except:
-        if DEBUG_MODE:
-            fatal(u'Ошибка получения результатов выполнения команды ОС <%s>' % cmd)
-    return lines
+    with log_context(base=base_name, phase='scheduled_jobs'):
+        return set_scheduled_jobs_1c_infobase(*args, **kwargs)
 
 
 def set_scheduled_jobs_1c_infobase(host=None, port=None, name=None, path_1c=None,
                                    admin=ADMIN_1C_NAME, password=ADMIN_1C_PASSWORD,
-                                   on_or_off=False):
+                                   on_or_off=False, wait=False, wait_timeout=DEFAULT_BACKGROUND_JOBS_TIMEOUT,
+                                   client=None):
     """
     Вкл/откл регламентных заданий информационной базы 1С.
+    Если режим уже установлен, то изменение не выполняется.
+    После изменения режим перечитывается для проверки.
 
     :param host: Сервер 1С
     :param port: Порт утилиты ras
@@ -429,49 +336,51 @@ def set_scheduled_jobs_1c_infobase(host=None, port=None, name=None, path_1c=None
     :param admin: Администратор 1С.
     :param password: Пароль администратора 1С.
     :param on_or_off: True - вкл блокировка регламентных заданий, False - откл блокировки регламентных заданий.
-    :return: True/False.
+    :param wait: После вкл. блокировки ожидать завершения уже запущенных фоновых заданий?
+    :param wait_timeout: Максимальное время ожидания завершения фоновых заданий в секундах.
+    :param client: Клиент кластера (ClusterClient). Если не определен, то создается по host, port и path_1c.
+    :return: True - режим установлен (и фоновые задания завершены) / False - режим установить не удалось.
     """
-    global DEBUG_MODE
-
     start_time = time.time()
-    if DEBUG_MODE:
-        info(u'Запуск вкл/откл регламентных заданий информационной базы 1С <%s>' % name)
+    info(u'Запуск вкл/откл регламентных заданий информационной базы 1С <%s>' % name)
 
     result = False
 
-    rac_filename = os.path.join(path_1c, 'rac')
-    # 1. Удаляем сеансы
-    # 1.1. Получить список кластеров
-    cmd = GET_1C_CLUSTERS_CMD_FMT % (rac_filename, host, port)
-    cluster_lines = get_lines_exec_cmd(cmd)
-    for i_cluster in range(int(len(cluster_lines) / 15)):
-        cluster_id = cluster_lines[i_cluster * 15].split(':')[1].strip()
-        # 1.2. Выбираем информационную базу 1С по имени
-        cmd = GET_1C_INFOBASES_CMD_FMT % (rac_filename, cluster_id, host, port)
-        infobase_lines = get_lines_exec_cmd(cmd)
-        for i_infobase in range(int(len(infobase_lines) / 4)):
-            # 1.3. Получаем идентификатор информационной базы 1С
-            infobase_id = infobase_lines[i_infobase * 4].split(':')[1].strip()
-            infobase_name = infobase_lines[i_infobase * 4 + 1].split(':')[1].strip()
-            # Проверку по имени баз 1с делаем регистронечувствительной
-            if infobase_name.lower() == name.strip().lower():
-                # Устанавливаем режим блокировки регламентных заданий информационной базы 1с
-                on_or_off_option = 'on' if on_or_off else 'off'
-                cmd = SET_1C_SCHEDULED_JOBS_CMD_FMT % (rac_filename, cluster_id, infobase_id, admin, password, on_or_off_option, host, port)
-                set_scheduled_jobs_lines = get_lines_exec_cmd(cmd)
-                if DEBUG_MODE and set_scheduled_jobs_lines:
-                    for line in set_scheduled_jobs_lines:
-                        warning(line.strip())
-
-                # Задержка после выполнения команды
-                if SYSTEM_TIME_SLEEP:
-                    time.sleep(SYSTEM_TIME_SLEEP)
-
-                # Окончание и выход
+    if client is None:
+        client = get_cluster_client(path_1c, host, port)
+    infobase = client.find_infobase(name)
+    if infobase is None:
+        error(u'Информационная база 1С <%s> не найдена на сервере <%s:%s>' % (name, host, port))
+        return result
+
+    state = client.get_infobase_deny(infobase, 'scheduled-jobs-deny', admin=admin, password=password)
+    if state is on_or_off:
+        info(u'Режим блокировки регламентных заданий информационной базы 1С <%s> уже установлен' % name)
+        result = True
+    else:
+        # Устанавливаем режим блокировки регламентных заданий информационной базы 1с
+        on_or_off_option = 'on' if on_or_off else 'off'
+        for line in client.set_infobase_deny(infobase, 'scheduled-jobs-deny', on_or_off_option,
+                                             admin=admin, password=password):
+            warning(line.strip())
+
+        # Проверяем, что режим действительно изменился
+        for i_attempt in range(VERIFY_ATTEMPTS):
+            state = client.get_infobase_deny(infobase, 'scheduled-jobs-deny', admin=admin, password=password)
+            if state is on_or_off:
+                result = True
                 break
+            if VERIFY_TIME_SLEEP:
+                time.sleep(VERIFY_TIME_SLEEP)
+
+        if not result:
+            error(u'Режим блокировки регламентных заданий информационной базы 1С <%s> не установлен' % name)
+
+    if result and on_or_off and wait:
+        result = client.wait_sessions(infobase, app_id=BACKGROUND_JOB_APP_ID, timeout=wait_timeout,
+                                      time_sleep=BACKGROUND_JOBS_TIME_SLEEP)
 
-    if DEBUG_MODE:
-        info(u'Останов вкл/откл регламентных заданий информационной базы 1С <%s> ... %s' % (name, time.time() - start_time))
+    info(u'Останов вкл/откл регламентных заданий информационной базы 1С <%s> ... %s' % (name, time.time() - start_time))
 
     return result
 
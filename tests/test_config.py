@@ -0,0 +1,51 @@
+"""
+Параметры запуска (BackupConfig): файл настроек, параметры командной строки и передача в задания.
+"""
+
+import os
+
+import backup_1c_base
+import config_1c
+import report_1c
+import storage_1c
+
+
+def test_config_from_settings(tmp_path):
+    settings_filename = str(tmp_path / 'settings.ini')
+    settings = dict(SETTINGS=dict(report_enable=True, report_to='admin@example.com', smtp_server='smtp',
+                                  compress='gzip:6', upload_streams=0, fsync_policy='always',
+                                  verify_backup=False),
+                    NFS_PROFILES=dict(fast='rsize=1048576'))
+    config = config_1c.BackupConfig.from_settings(settings, settings_filename=settings_filename,
+                                                       compress='xz:0', encrypt_key=None)
+
+    # Параметры, заданные явно, переопределяют файл настроек, значения None не учитываются
+    assert config.compress == 'xz:0'
+    assert config.encrypt_key is None
+    assert config.report_enable and config.report_to == ('admin@example.com', )
+    assert config.upload_streams == 1
+    assert config.fsync_policy == 'close'
+    assert config.verify_backup is False
+    assert config.nfs_profiles == dict(fast='rsize=1048576')
+    assert config.history_filename == os.path.join(str(tmp_path), config_1c.DEFAULT_HISTORY_FILENAME)
+    assert config.report_outbox == os.path.join(str(tmp_path), report_1c.DEFAULT_REPORT_OUTBOX_DIRNAME)
+
+
+def test_config_is_passed_to_job_and_writer(tmp_path):
+    config = config_1c.BackupConfig(compress='gzip:1', encrypt_key='key.pem', preallocate=False,
+                                         upload_streams=1, fsync_policy='none')
+    job = backup_1c_base.BackupJob.from_settings(dict(name='BUH', compress='bz2:1'), config=config, client=object())
+    # Настройки базы важнее параметров запуска
+    assert job.compress == 'bz2:1'
+    assert job.encrypt_key == 'key.pem'
+    assert job.config is config
+
+    with storage_1c.get_storage_backend('file://' + str(tmp_path), config=config) as backend:
+        writer = backend.open_write('BUH.dt', size=1024)
+        assert not writer.preallocated and not writer.segmented
+        assert writer.fsync_policy == 'none'
+        writer.write(b'data')
+        writer.close()
+    assert (tmp_path / 'BUH.dt').read_bytes() == b'data'
+    # Параметры запуска по умолчанию не меняются
+    assert config_1c.BackupConfig().upload_streams == config_1c.DEFAULT_UPLOAD_STREAMS
@@ -0,0 +1,131 @@
+"""
+Потоковое шифрование резервных копий (AES-256-GCM): расшифровка, обрезание, перестановка блоков и неверный ключ.
+"""
+
+import io
+import os
+import struct
+
+import pytest
+
+pytest.importorskip('cryptography')
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+import encrypt_1c
+
+CHUNK_SIZE = 16
+DATA = bytes(range(256)) * 3 + b'tail'
+
+
+@pytest.fixture
+def key_filename(tmp_path):
+    filename = tmp_path / 'backup.key'
+    filename.write_text(os.urandom(encrypt_1c.ENCRYPT_KEY_SIZE).hex())
+    return str(filename)
+
+
+def encrypt(key_filename, data, portion=7):
+    encryptor = encrypt_1c.StreamEncryptor(key_filename, chunk_size=CHUNK_SIZE)
+    chunks = [encryptor.encrypt(data[offset:offset + portion]) for offset in range(0, len(data), portion)]
+    chunks.append(encryptor.flush())
+    return b''.join(chunks)
+
+
+def decrypt(key_filename, encrypted, size=5):
+    reader = encrypt_1c.DecryptingReader(io.BytesIO(encrypted), key_filename)
+    chunks = list()
+    while True:
+        data = reader.read(size)
+        if not data:
+            return b''.join(chunks)
+        chunks.append(data)
+
+
+def split_blocks(encrypted):
+    # Заголовок и блоки по CHUNK_SIZE байт с меткой аутентификации
+    magic_size = len(encrypt_1c.ENCRYPT_MAGIC)
+    header_size = magic_size + 4 + struct.unpack('>I', encrypted[magic_size:magic_size + 4])[0]
+    block_size = CHUNK_SIZE + encrypt_1c.ENCRYPT_TAG_SIZE
+    return encrypted[:header_size], [encrypted[offset:offset + block_size]
+                                     for offset in range(header_size, len(encrypted), block_size)]
+
+
+@pytest.mark.parametrize('data', [DATA, DATA[:CHUNK_SIZE * 4], b''])
+def test_round_trip(key_filename, data):
+    encrypted = encrypt(key_filename, data)
+    assert decrypt(key_filename, encrypted) == data
+    assert decrypt(key_filename, encrypted, size=-1) == data
+
+
+def test_copy_encrypts_same_bytes(key_filename):
+    encryptor = encrypt_1c.StreamEncryptor(key_filename, chunk_size=CHUNK_SIZE)
+    copy = encryptor.copy()
+    encrypted = encryptor.encrypt(DATA) + encryptor.flush()
+    assert copy.encrypt(DATA) + copy.flush() == encrypted
+
+
+def test_rsa_key(tmp_path):
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_filename = tmp_path / 'backup.pem'
+    private_filename.write_bytes(private_key.private_bytes(serialization.Encoding.PEM,
+                                                           serialization.PrivateFormat.PKCS8,
+                                                           serialization.NoEncryption()))
+    public_filename = tmp_path / 'backup.pub.pem'
+    public_filename.write_bytes(private_key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo))
+
+    # Шифрование открытым ключом, расшифровка только закрытым
+    encrypted = encrypt(str(public_filename), DATA)
+    assert decrypt(str(private_filename), encrypted) == DATA
+    with pytest.raises(ValueError, match='Private RSA key'):
+        decrypt(str(public_filename), encrypted)
+
+
+def test_truncation_is_detected(key_filename):
+    encrypted = encrypt(key_filename, DATA)
+    header, blocks = split_blocks(encrypted)
+
+    # Файл обрезан по границе блока: предпоследний блок не помечен как последний
+    with pytest.raises(ValueError, match='corrupted or the file is truncated'):
+        decrypt(key_filename, header + b''.join(blocks[:-1]))
+    # Файл обрезан внутри блока
+    with pytest.raises(ValueError):
+        decrypt(key_filename, encrypted[:-3])
+    # Остались только заголовок и часть метки
+    with pytest.raises(ValueError, match='truncated at block 0'):
+        decrypt(key_filename, header + blocks[0][:encrypt_1c.ENCRYPT_TAG_SIZE - 1])
+    with pytest.raises(ValueError, match='header is truncated'):
+        decrypt(key_filename, header[:-1])
+
+
+def test_reordering_is_detected(key_filename):
+    header, blocks = split_blocks(encrypt(key_filename, DATA))
+    blocks[1], blocks[2] = blocks[2], blocks[1]
+
+    reader = encrypt_1c.DecryptingReader(io.BytesIO(header + b''.join(blocks)), key_filename)
+    # Первый блок на месте и расшифровывается, ошибка - на переставленном
+    assert reader.read(CHUNK_SIZE) == DATA[:CHUNK_SIZE]
+    with pytest.raises(ValueError, match='block 1'):
+        reader.read(CHUNK_SIZE)
+
+
+def test_corrupted_header_is_detected(key_filename):
+    header, blocks = split_blocks(encrypt(key_filename, DATA))
+    # Заголовок входит в дополнительные данные каждого блока: изменение без изменения длины и смысла
+    header = header.replace(b', "wrap"', b',"wrap" ')
+    assert b',"wrap" ' in header
+    with pytest.raises(ValueError, match='block 0'):
+        decrypt(key_filename, header + b''.join(blocks))
+
+
+def test_wrong_key(key_filename, tmp_path):
+    encrypted = encrypt(key_filename, DATA)
+    other_filename = tmp_path / 'other.key'
+    other_filename.write_bytes(os.urandom(encrypt_1c.ENCRYPT_KEY_SIZE))
+
+    with pytest.raises(ValueError, match='another key'):
+        decrypt(str(other_filename), encrypted)
+    with pytest.raises(ValueError, match='Not an encrypted backup'):
+        decrypt(key_filename, DATA)
@@ -0,0 +1,110 @@
+"""
+Задание создания резервной копии (BackupJob) с клиентом кластера, записывающим вызовы.
+"""
+
+import pytest
+
+import common_1c
+
+import backup_1c_base
+
+
+class FakeClusterClient(object):
+    """
+    Клиент кластера без сервера 1С: записывает вызовы и хранит режимы блокировок.
+    """
+    rac_filename = '/opt/1cv8/x86_64/rac'
+    host = 'srv1c'
+    port = 1545
+
+    def __init__(self, denies=None):
+        self.calls = list()
+        self.denies = dict(denies or dict())
+        self.infobase = common_1c.Infobase('cluster-1', 'infobase-1', 'BUH')
+
+    def find_infobase(self, name):
+        return self.infobase
+
+    def get_infobase_deny(self, infobase, param, admin=None, password=None):
+        return self.denies.get(param, False)
+
+    def set_infobase_deny(self, infobase, param, value, admin=None, password=None, permission_code=None):
+        self.calls.append(('deny', param, value))
+        self.denies[param] = value == 'on'
+        return list()
+
+    def wait_sessions(self, infobase, app_id=None, timeout=None, cancel_event=None):
+        self.calls.append(('wait', app_id))
+        return True
+
+    def get_sessions(self, infobase, app_id=None, max_age=None):
+        self.calls.append(('sessions', ))
+        return list()
+
+    def terminate_sessions(self, infobase, sessions):
+        return list()
+
+    def get_locks(self, infobase):
+        return list()
+
+
+def test_background_jobs_drain_before_sessions_deny():
+    client = FakeClusterClient()
+    job = backup_1c_base.BackupJob(name='BUH', scheduled_jobs=True, client=client)
+    job.close_sessions(client.infobase)
+
+    # Пользователи блокируются только на время закрытия сеансов, а не на время ожидания фоновых заданий
+    assert client.calls == [('deny', 'scheduled-jobs-deny', 'on'),
+                            ('wait', backup_1c_base.BACKGROUND_JOB_APP_ID),
+                            ('deny', 'sessions-deny', 'on'),
+                            ('sessions', ),
+                            ('deny', 'sessions-deny', 'off')]
+
+
+def test_denies_released_on_phase_error(monkeypatch):
+    client = FakeClusterClient()
+    job = backup_1c_base.BackupJob(name='BUH', scheduled_jobs=True, client=client)
+
+    def failed_dump(infobase, dt_filename):
+        raise OSError('No space left on device')
+    monkeypatch.setattr(job, 'dump', failed_dump)
+
+    with pytest.raises(OSError):
+        job.run()
+
+    # Ошибка выгрузки не оставляет базу с запретом регламентных заданий
+    assert client.calls[-1] == ('deny', 'scheduled-jobs-deny', 'off')
+    assert client.denies == {'scheduled-jobs-deny': False, 'sessions-deny': False}
+    assert job.denied == list()
+
+
+def test_admin_denies_are_kept(tmp_path):
+    client = FakeClusterClient(denies={'sessions-deny': True, 'scheduled-jobs-deny': True})
+    journal = backup_1c_base.ClusterStateJournal(str(tmp_path))
+    job = backup_1c_base.BackupJob(name='BUH', scheduled_jobs=True, client=client, journal=journal)
+    job.close_sessions(client.infobase)
+    job.release_denies(client.infobase)
+
+    # Блокировки, включенные администратором заранее, задание не меняет и не журналирует
+    assert [call for call in client.calls if call[0] == 'deny'] == list()
+    assert client.denies == {'sessions-deny': True, 'scheduled-jobs-deny': True}
+    assert job.denied == list()
+    assert journal.pending == dict()
+
+
+def test_journal_records_previous_value(tmp_path):
+    client = FakeClusterClient()
+    journal = backup_1c_base.ClusterStateJournal(str(tmp_path))
+    assert backup_1c_base.set_infobase_deny(client, client.infobase, 'BUH', 'admin', '', 'sessions-deny', 'on',
+                                            journal=journal)
+    assert [change['revert'] for change in journal.pending.values()] == ['off']
+
+    # Повторное включение не меняет режим и не перезаписывает значение для отката
+    assert not backup_1c_base.set_infobase_deny(client, client.infobase, 'BUH', 'admin', '', 'sessions-deny', 'on',
+                                                journal=journal)
+    assert [change['revert'] for change in journal.pending.values()] == ['off']
+
+    assert backup_1c_base.set_infobase_deny(client, client.infobase, 'BUH', 'admin', '', 'sessions-deny', 'off',
+                                            journal=journal)
+    assert journal.pending == dict()
+    assert client.calls == [('deny', 'sessions-deny', 'on'), ('deny', 'sessions-deny', 'off')]
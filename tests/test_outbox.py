@@ -0,0 +1,118 @@
+"""
+Отправка отчетов из очереди на локальный SMTP сервер (aiosmtpd).
+"""
+
+import email
+import email.policy
+import os
+import socket
+
+import pytest
+
+aiosmtpd_controller = pytest.importorskip('aiosmtpd.controller')
+
+import report_1c
+
+
+class RecordingHandler(object):
+    """
+    Обработчик SMTP сервера: принимает и запоминает письма или отклоняет их.
+    """
+    def __init__(self, refuse=False):
+        self.refuse = refuse
+        self.messages = list()
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.refuse:
+            return '554 Message refused'
+        self.messages.append(envelope)
+        return '250 OK'
+
+
+@pytest.fixture
+def smtp_server():
+    servers = list()
+
+    def start(refuse=False):
+        with socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            port = probe.getsockname()[1]
+        handler = RecordingHandler(refuse=refuse)
+        controller = aiosmtpd_controller.Controller(handler, hostname='127.0.0.1', port=port)
+        controller.start()
+        servers.append(controller)
+        return handler, '127.0.0.1', port
+
+    yield start
+    for controller in servers:
+        controller.stop()
+
+
+def enqueue(outbox_dir, tmp_path, subject='Report'):
+    attached = tmp_path / 'backup.log'
+    attached.write_text('log line\n' * 100)
+    return report_1c.enqueue_report(str(outbox_dir), send_from='backup@example.com',
+                                         send_to=['admin@example.com'], subject=subject, body='Body',
+                                         attached=[str(attached)])
+
+
+def test_deliver_outbox_sends_and_removes_report(smtp_server, tmp_path):
+    handler, host, port = smtp_server()
+    outbox_dir = tmp_path / 'outbox'
+    report_dirname = enqueue(outbox_dir, tmp_path)
+    assert os.path.isdir(report_dirname)
+
+    assert report_1c.deliver_outbox(str(outbox_dir), smtp_server=host, smtp_server_port=port)
+    assert len(handler.messages) == 1
+    assert handler.messages[0].mail_from == 'backup@example.com'
+    assert handler.messages[0].rcpt_tos == ['admin@example.com']
+    assert b'Subject: Report' in handler.messages[0].content
+    assert report_1c.get_outbox_reports(str(outbox_dir)) == []
+
+
+def test_deliver_outbox_merges_pending_reports(smtp_server, tmp_path):
+    handler, host, port = smtp_server()
+    outbox_dir = tmp_path / 'outbox'
+    enqueue(outbox_dir, tmp_path, subject='First')
+    enqueue(outbox_dir, tmp_path, subject='Second')
+
+    assert report_1c.deliver_outbox(str(outbox_dir), smtp_server=host, smtp_server_port=port)
+    assert len(handler.messages) == 1
+    message = email.message_from_bytes(handler.messages[0].content, policy=email.policy.default)
+    assert message['Subject'].startswith('Second')
+    body = message.get_body(preferencelist=('plain', )).get_content()
+    assert 'First' in body and 'Second' in body
+
+
+def test_refused_report_stays_in_outbox(smtp_server, tmp_path):
+    handler, host, port = smtp_server(refuse=True)
+    outbox_dir = tmp_path / 'outbox'
+    report_dirname = enqueue(outbox_dir, tmp_path)
+
+    assert not report_1c.deliver_outbox(str(outbox_dir), smtp_server=host, smtp_server_port=port)
+    assert handler.messages == []
+    assert [dirname for dirname, meta in report_1c.get_outbox_reports(str(outbox_dir))] == [report_dirname]
+
+
+def test_outbox_sender_retries_until_timeout(smtp_server, tmp_path):
+    handler, host, port = smtp_server(refuse=True)
+    outbox_dir = tmp_path / 'outbox'
+    enqueue(outbox_dir, tmp_path)
+
+    sender = report_1c.OutboxSender(str(outbox_dir), smtp_server=host, smtp_server_port=port,
+                                         retry_delay=0.1, max_retry_delay=0.2)
+    sender.start()
+    assert not sender.finish(timeout=1)
+    assert len(report_1c.get_outbox_reports(str(outbox_dir))) == 1
+
+
+def test_outbox_sender_delivers_on_finish(smtp_server, tmp_path):
+    handler, host, port = smtp_server()
+    outbox_dir = tmp_path / 'outbox'
+    enqueue(outbox_dir, tmp_path)
+
+    sender = report_1c.OutboxSender(str(outbox_dir), smtp_server=host, smtp_server_port=port)
+    sender.start()
+    assert sender.finish(timeout=10)
+    assert len(handler.messages) == 1
+    assert report_1c.get_outbox_reports(str(outbox_dir)) == []
@@ -0,0 +1,197 @@
+"""
+Общая очередь баз: координатор и обработчики на временной папке очереди.
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+
+import pytest
+
+import backup_1c_base
+import config_1c
+import queue_1c
+
+
+@pytest.fixture
+def fast_queue(monkeypatch):
+    monkeypatch.setattr(queue_1c, 'QUEUE_POLL_TIME_SLEEP', 0.05)
+    monkeypatch.setattr(queue_1c, 'QUEUE_LEASE_RENEW', 0.05)
+    return config_1c.BackupConfig(preflight=False, history_filename=None)
+
+
+def start_workers(queue_dir, settings, config, count=2, **kwargs):
+    results = dict()
+
+    def run(index):
+        results[index] = backup_1c_base.run_queue_worker(queue_dir, settings, start_timeout=5, config=config, **kwargs)
+
+    threads = [threading.Thread(target=run, args=(index, ), daemon=True) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def test_coordinator_and_two_workers(fast_queue, monkeypatch, tmp_path):
+    processed = list()
+    lock = threading.Lock()
+
+    def backup_task(base_name, base, client=None, progress=None, config=None):
+        with lock:
+            processed.append((base_name, threading.current_thread().name))
+        return base_name != 'KADRY'
+
+    monkeypatch.setattr(backup_1c_base, 'backup_1c_base_task', backup_task)
+    base_names = ['BUH', 'KADRY', 'ZUP', 'UT']
+    settings = dict([(base_name, dict(name=base_name)) for base_name in base_names])
+    queue_dir = str(tmp_path / 'queue')
+
+    coordinator_result = list()
+    coordinator = threading.Thread(target=lambda: coordinator_result.append(
+        backup_1c_base.run_queue_coordinator(queue_dir, base_names, settings, timeout=10,
+                                             config=fast_queue)), daemon=True)
+    coordinator.start()
+    threads, results = start_workers(queue_dir, settings, fast_queue)
+    for thread in threads + [coordinator]:
+        thread.join(timeout=20)
+
+    assert sorted([base_name for base_name, _ in processed]) == sorted(base_names)
+    # Ошибка базы KADRY попадает в результат координатора
+    assert coordinator_result == [False]
+    assert len(results) == 2 and not all(results.values())
+    work_queue = queue_1c.WorkQueue(queue_dir)
+    assert work_queue.open_current()
+    assert work_queue.is_finished()
+    assert dict([(item['base'], item['result']) for item in work_queue.get_results()]) == \
+        dict(BUH=True, KADRY=False, ZUP=True, UT=True)
+    assert fast_queue.report.get_text().count(u'Да') == 3
+
+
+def test_coordinator_timeout_fails_unclaimed_bases(fast_queue, monkeypatch, tmp_path):
+    release = threading.Event()
+
+    def backup_task(base_name, base, client=None, progress=None, config=None):
+        release.wait(10)
+        return True
+
+    monkeypatch.setattr(backup_1c_base, 'backup_1c_base_task', backup_task)
+    base_names = ['BUH', 'KADRY', 'ZUP']
+    settings = dict([(base_name, dict(name=base_name)) for base_name in base_names])
+    queue_dir = str(tmp_path / 'queue')
+
+    coordinator_result = list()
+    coordinator = threading.Thread(target=lambda: coordinator_result.append(
+        backup_1c_base.run_queue_coordinator(queue_dir, base_names, settings, timeout=1,
+                                             config=fast_queue)), daemon=True)
+    coordinator.start()
+    # Один обработчик берет одну базу и не успевает обработать ее до истечения времени ожидания
+    threads, results = start_workers(queue_dir, settings, fast_queue, count=1)
+    coordinator.join(timeout=10)
+    assert coordinator_result == [False]
+
+    work_queue = queue_1c.WorkQueue(queue_dir)
+    assert work_queue.open_current()
+    assert not work_queue.list_items('pending')
+    failed = work_queue.get_results()
+    assert len(failed) == 2
+    assert all([not item['result'] and item['error'] for item in failed])
+    assert len(work_queue.list_items('claimed')) == 1
+
+    # Обработчик дописывает результат взятой базы после истечения времени ожидания координатора
+    release.set()
+    for thread in threads:
+        thread.join(timeout=10)
+    assert work_queue.is_finished()
+    assert results == {0: True}
+
+
+def test_fail_unfinished_marks_expired_lease(fast_queue, monkeypatch, tmp_path):
+    monkeypatch.setattr(queue_1c, 'QUEUE_MAX_ATTEMPTS', 1)
+    work_queue = queue_1c.WorkQueue(str(tmp_path))
+    work_queue.create('run', ['BUH', 'KADRY'])
+    item, base_name = work_queue.claim('dead-worker')
+    work_queue.write_json(work_queue.get_path('claimed', item + queue_1c.QUEUE_LEASE_SUFFIX),
+                          dict(worker='dead-worker', expires=0))
+
+    assert work_queue.fail_unfinished('timeout') == []
+    assert work_queue.is_finished()
+    assert [(item['base'], item['result']) for item in work_queue.get_results()] == [('BUH', False), ('KADRY', False)]
+
+
+def test_expired_lease_reclaimed_by_other_worker(fast_queue, tmp_path):
+    work_queue = queue_1c.WorkQueue(str(tmp_path))
+    work_queue.create('run', ['BUH'])
+    item, base_name = work_queue.claim('worker-1')
+    work_queue.write_json(work_queue.get_path('claimed', item + queue_1c.QUEUE_LEASE_SUFFIX),
+                          dict(worker='worker-1', expires=0))
+    assert work_queue.requeue_expired() == 1
+    assert work_queue.claim('worker-2') == (item, 'BUH')
+
+    # Прежний обработчик не продлевает чужую аренду и не записывает результат чужой базы
+    assert not work_queue.renew(item, 'worker-1')
+    assert not work_queue.complete(item, 'worker-1', dict(result=True, worker='worker-1'))
+    assert work_queue.is_owner(item, 'worker-2')
+    assert work_queue.renew(item, 'worker-2')
+    assert work_queue.complete(item, 'worker-2', dict(result=True, worker='worker-2'))
+    assert [(result['base'], result['worker'], result['attempts']) for result in work_queue.get_results()] == \
+        [('BUH', 'worker-2', 1)]
+
+
+def test_lease_keeper_cancels_backup_on_lost_lease(fast_queue, tmp_path):
+    work_queue = queue_1c.WorkQueue(str(tmp_path))
+    work_queue.create('run', ['BUH'])
+    item, base_name = work_queue.claim('worker-1')
+    progress = backup_1c_base.BackupProgress('BUH')
+    lease_keeper = queue_1c.LeaseKeeper(work_queue, item, 'worker-1', progress=progress)
+    lease_keeper.start()
+    # Аренду истекшей базы взял другой обработчик
+    work_queue.write_lease(item, 'worker-2')
+    lease_keeper.join(timeout=5)
+
+    assert lease_keeper.lost
+    assert progress.is_cancelled()
+    assert work_queue.is_owner(item, 'worker-2')
+
+
+def run_worker_process(queue_dir, settings, config, processed_dir):
+    """
+    Обработчик очереди в отдельном процессе: каждая база отмечается файлом <база>.<pid>.
+    """
+    def backup_task(base_name, base, client=None, progress=None, config=None):
+        with open(os.path.join(processed_dir, '%s.%d' % (base_name, os.getpid())), 'wt') as processed_file:
+            processed_file.write(base_name)
+        time.sleep(0.2)
+        return True
+
+    backup_1c_base.backup_1c_base_task = backup_task
+    os._exit(0 if backup_1c_base.run_queue_worker(queue_dir, settings, start_timeout=5, config=config) else 1)
+
+
+def test_workers_in_several_processes(fast_queue, tmp_path):
+    base_names = ['BUH', 'KADRY', 'ZUP', 'UT', 'ERP', 'DO']
+    settings = dict([(base_name, dict(name=base_name)) for base_name in base_names])
+    queue_dir = str(tmp_path / 'queue')
+    processed_dir = tmp_path / 'processed'
+    processed_dir.mkdir()
+    work_queue = queue_1c.WorkQueue(queue_dir)
+    os.makedirs(queue_dir)
+    work_queue.create('run', base_names)
+
+    context = multiprocessing.get_context('fork')
+    processes = [context.Process(target=run_worker_process, args=(queue_dir, settings, fast_queue, str(processed_dir)))
+                 for _ in range(3)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=30)
+    assert [process.exitcode for process in processes] == [0, 0, 0]
+
+    # Каждая база обработана ровно один раз, обработчиками разных процессов
+    processed = [filename.split('.') for filename in os.listdir(str(processed_dir))]
+    assert sorted([base_name for base_name, pid in processed]) == sorted(base_names)
+    assert len(set([pid for base_name, pid in processed])) > 1
+    assert work_queue.is_finished()
+    results = work_queue.get_results()
+    assert all([result['result'] for result in results])
+    assert set([result['worker'].split('-')[-2] for result in results]) == set([pid for base_name, pid in processed])
@@ -0,0 +1,306 @@
+"""
+Собственный клиент протокола RAS на локальном заменителе сервера ras.
+"""
+
+import os
+import select
+import socketserver
+import stat
+import struct
+import sys
+import threading
+import uuid
+
+import pytest
+
+import common_1c
+from common_1c import (ClusterClient, RasReader, ras_pack_fields, ras_pack_packet, ras_pack_size, ras_pack_value,
+                       ras_unpack_size)
+
+CLUSTER_ID = str(uuid.uuid4())
+INFOBASE_ID = str(uuid.uuid4())
+OTHER_INFOBASE_ID = str(uuid.uuid4())
+PASSWORD = 'secret'
+
+
+class FakeRasHandler(socketserver.BaseRequestHandler):
+    """
+    Соединение заменителя ras.
+    Ответы на сообщения копятся, пока клиент продолжает отправку, и отправляются вместе:
+    размер пачки показывает, ждет ли клиент ответа на каждый запрос.
+    """
+    def setup(self):
+        self.buffer = bytearray()
+        self.authenticated = set()
+        self.infobase_password = None
+
+    def read_exact(self, size):
+        while len(self.buffer) < size:
+            data = self.request.recv(65536)
+            if not data:
+                raise EOFError()
+            self.buffer += data
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def has_data(self, timeout=0.2):
+        return bool(self.buffer) or bool(select.select([self.request], [], [], timeout)[0])
+
+    def read_packet(self):
+        packet_type = self.read_exact(1)[0]
+        return packet_type, RasReader(self.read_exact(ras_unpack_size(lambda: self.read_exact(1)[0])))
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        try:
+            magic, protocol, version = struct.unpack('>iHH', self.read_exact(8))
+            assert magic == common_1c.RAS_NEGOTIATE_MAGIC
+            packet_type, reader = self.read_packet()
+            assert packet_type == common_1c.RAS_CONNECT
+            if server.mode == 'garbage':
+                self.request.sendall(ras_pack_packet(common_1c.RAS_ENDPOINT_OPEN_ACK, b''))
+                return
+            self.request.sendall(ras_pack_packet(common_1c.RAS_CONNECT_ACK, b''))
+            packet_type, reader = self.read_packet()
+            assert packet_type == common_1c.RAS_ENDPOINT_OPEN
+            assert reader.read_value('str') == common_1c.RAS_SERVICE_NAME
+            self.request.sendall(ras_pack_packet(common_1c.RAS_ENDPOINT_OPEN_ACK,
+                                                 ras_pack_value('str', common_1c.RAS_SERVICE_NAME) +
+                                                 ras_pack_value('str', common_1c.RAS_SERVICE_VERSION) +
+                                                 ras_pack_size(1)))
+            batches = 0
+            while True:
+                pending = list()
+                while True:
+                    packet_type, reader = self.read_packet()
+                    assert packet_type == common_1c.RAS_ENDPOINT_MESSAGE
+                    reader.read_size()
+                    reader.read_value('short')
+                    assert reader.read_byte() == common_1c.RAS_MESSAGE
+                    message_type = reader.read_byte()
+                    pending.append((message_type, self.respond(message_type, reader)))
+                    if not self.has_data():
+                        break
+                with server.lock:
+                    server.batches.append([message_type for message_type, response in pending])
+                self.request.sendall(b''.join([response for message_type, response in pending]))
+                batches += 1
+                if server.close_after and batches >= server.close_after:
+                    return
+        except EOFError:
+            pass
+
+    @staticmethod
+    def message(kind, body=b''):
+        return ras_pack_packet(common_1c.RAS_ENDPOINT_MESSAGE,
+                               ras_pack_size(1) + ras_pack_value('short', 0) + bytes([kind]) + body)
+
+    def reply(self, message_type, body):
+        return self.message(common_1c.RAS_MESSAGE, bytes([message_type]) + body)
+
+    def fail(self, text):
+        return self.message(common_1c.RAS_EXCEPTION_MESSAGE,
+                            ras_pack_value('str', 'AdminException') + ras_pack_value('str', text))
+
+    def respond(self, message_type, reader):
+        state = self.server.state
+        if message_type == common_1c.RAS_GET_CLUSTERS_REQUEST:
+            return self.reply(common_1c.RAS_GET_CLUSTERS_RESPONSE, ras_pack_size(1) + ras_pack_fields(
+                common_1c.RAS_CLUSTER_FIELDS, dict(cluster=CLUSTER_ID, host='srv', port=1541, name='Local')))
+
+        cluster_id = reader.read_value('uuid')
+        if message_type == common_1c.RAS_AUTHENTICATE_REQUEST:
+            self.authenticated.add(cluster_id)
+            return self.message(common_1c.RAS_VOID_MESSAGE)
+        if cluster_id not in self.authenticated:
+            return self.fail('Cluster administrator is not authenticated')
+        if message_type == common_1c.RAS_ADD_AUTHENTICATION_REQUEST:
+            reader.read_value('str')
+            self.infobase_password = reader.read_value('str')
+            return self.message(common_1c.RAS_VOID_MESSAGE)
+        if message_type == common_1c.RAS_GET_INFOBASES_SHORT_REQUEST:
+            infobases = state['infobases']
+            return self.reply(common_1c.RAS_GET_INFOBASES_SHORT_RESPONSE, ras_pack_size(len(infobases)) + b''.join(
+                [ras_pack_fields(common_1c.RAS_INFOBASE_SHORT_FIELDS, values) for values in infobases.values()]))
+        if message_type == common_1c.RAS_GET_INFOBASE_INFO_REQUEST:
+            if self.infobase_password != PASSWORD:
+                return self.fail('Insufficient user rights for infobase')
+            values = state['infobases'][reader.read_value('uuid')]
+            return self.reply(common_1c.RAS_GET_INFOBASE_INFO_RESPONSE,
+                              ras_pack_fields(common_1c.RAS_INFOBASE_FIELDS, values))
+        if message_type == common_1c.RAS_GET_SESSIONS_REQUEST:
+            sessions = state['sessions']
+            return self.reply(common_1c.RAS_GET_SESSIONS_RESPONSE, ras_pack_size(len(sessions)) + b''.join(
+                [ras_pack_fields(common_1c.RAS_SESSION_FIELDS, values) for values in sessions]))
+        if message_type == common_1c.RAS_GET_INFOBASE_LOCKS_REQUEST:
+            infobase_id = reader.read_value('uuid')
+            locks = [lock for lock in state['locks'] if lock['infobase'] == infobase_id]
+            return self.reply(common_1c.RAS_GET_INFOBASE_LOCKS_RESPONSE, ras_pack_size(len(locks)) + b''.join(
+                [ras_pack_fields(common_1c.RAS_LOCK_FIELDS, lock) for lock in locks]))
+        return self.fail('Unknown message type %d' % message_type)
+
+
+class FakeRasServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, mode='normal', close_after=0):
+        socketserver.ThreadingTCPServer.__init__(self, ('127.0.0.1', 0), FakeRasHandler)
+        self.mode = mode
+        self.close_after = close_after
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.batches = list()
+        self.state = dict(
+            infobases={INFOBASE_ID: dict(infobase=INFOBASE_ID, name='Buh', descr='', locale='ru_RU',
+                                         **{'sessions-deny': True, 'permission-code': 'backup'}),
+                       OTHER_INFOBASE_ID: dict(infobase=OTHER_INFOBASE_ID, name='Kadry', descr='')},
+            sessions=[dict(session=str(uuid.uuid4()), infobase=INFOBASE_ID, host='pc%d' % index,
+                           **{'app-id': '1CV8C', 'user-name': 'user%d' % index,
+                                 'session-id': index, 'started-at': 638000000000000})
+                      for index in range(3)] +
+                     [dict(session=str(uuid.uuid4()), infobase=OTHER_INFOBASE_ID,
+                           **{'app-id': 'BackgroundJob', 'user-name': 'robot'})],
+            locks=[dict(infobase=INFOBASE_ID, connection=str(uuid.uuid4()), session=str(uuid.uuid4()),
+                        descr='DB:Document.Sale')])
+
+
+@pytest.fixture
+def ras_server():
+    servers = list()
+
+    def start(**kwargs):
+        server = FakeRasServer(**kwargs)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def fake_rac(tmp_path):
+    # Заменитель утилиты rac: записывает аргументы в rac.log, на список кластеров отвечает одним кластером
+    rac_filename = tmp_path / 'rac'
+    rac_filename.write_text('#!%s\n'
+                            'import sys\n'
+                            'with open(%r, "a") as log_file:\n'
+                            '    log_file.write(" ".join(sys.argv[1:]) + "\\n")\n'
+                            'if sys.argv[1] == "cluster":\n'
+                            '    print("cluster : rac-cluster\\nname : Local\\n")\n'
+                            % (sys.executable, str(tmp_path / 'rac.log')))
+    os.chmod(str(rac_filename), os.stat(str(rac_filename)).st_mode | stat.S_IEXEC)
+    return str(tmp_path)
+
+
+def make_client(server, path_1c=''):
+    host, port = server.server_address
+    return ClusterClient(path_1c, host, port, transport=common_1c.RAS_TRANSPORT)
+
+
+def read_rac_log(path_1c):
+    with open(os.path.join(path_1c, 'rac.log')) as log_file:
+        return log_file.read().splitlines()
+
+
+def test_operations_share_one_connection(ras_server):
+    server = ras_server()
+    client = make_client(server)
+
+    infobase = client.find_infobase('buh')
+    assert infobase.infobase_id == INFOBASE_ID and infobase.cluster_id == CLUSTER_ID
+    assert client.get_infobase_deny(infobase, 'sessions-deny', password=PASSWORD) is True
+    assert client.get_infobase_deny(infobase, 'scheduled-jobs-deny', password=PASSWORD) is False
+    info = client.get_infobase_info(infobase, password=PASSWORD)
+    assert info['permission-code'] == 'backup' and info['locale'] == 'ru_RU'
+
+    sessions = client.get_sessions(infobase, max_age=0)
+    assert [session.user_name for session in sessions] == ['user0', 'user1', 'user2']
+    assert sessions[0].app_id == '1CV8C' and sessions[0].started_at.startswith('2022-')
+    assert [session.user_name for session in client.get_sessions(client.find_infobase('Kadry'),
+                                                                  app_id=common_1c.BACKGROUND_JOB_APP_ID)] == ['robot']
+    assert 'descr : DB:Document.Sale' in client.get_locks(infobase)
+
+    assert server.connections == 1
+    assert client.transport.name == common_1c.RAS_TRANSPORT
+    client.close()
+
+
+def test_changes_are_made_by_rac(ras_server, fake_rac):
+    server = ras_server()
+    client = make_client(server, path_1c=fake_rac)
+    infobase = client.find_infobase('Buh')
+    sessions = client.get_sessions(infobase, max_age=0)
+
+    assert client.set_infobase_deny(infobase, 'scheduled-jobs-deny', 'on', password=PASSWORD) == []
+    assert [lines for session, lines in client.terminate_sessions(infobase, sessions)] == [[], [], []]
+
+    # Изменения кластера не отправляются серверу ras: параметры базы и сеансы меняет утилита rac
+    rac_commands = read_rac_log(fake_rac)
+    assert len(rac_commands) == 4
+    assert 'update --infobase=%s' % INFOBASE_ID in rac_commands[0]
+    assert '--scheduled-jobs-deny=on' in rac_commands[0]
+    assert sorted(command.split(' ')[3] for command in rac_commands[1:]) == \
+        sorted('--session=%s' % session.session_id for session in sessions)
+    assert client.get_infobase_deny(infobase, 'scheduled-jobs-deny', password=PASSWORD) is False
+    assert len(client.get_sessions(infobase)) == 3
+    assert client.transport.name == common_1c.RAS_TRANSPORT
+    assert server.connections == 1
+
+
+def test_server_error_does_not_switch_to_rac(ras_server):
+    server = ras_server()
+    client = make_client(server)
+    infobase = client.find_infobase('Buh')
+
+    assert client.get_infobase_info(infobase, password='wrong') == dict()
+    assert client.get_infobase_deny(infobase, 'scheduled-jobs-deny', password='wrong') is None
+    assert client.transport.name == common_1c.RAS_TRANSPORT
+
+
+def test_reconnects_when_server_closes_connection(ras_server):
+    server = ras_server(close_after=1)
+    client = make_client(server)
+
+    assert client.get_clusters() == [CLUSTER_ID]
+    assert client.get_clusters() == [CLUSTER_ID]
+    assert server.connections == 2
+    assert client.transport.name == common_1c.RAS_TRANSPORT
+
+
+def test_protocol_error_falls_back_to_rac(ras_server, fake_rac):
+    server = ras_server(mode='garbage')
+    client = make_client(server, path_1c=fake_rac)
+
+    assert client.get_clusters() == ['rac-cluster']
+    assert client.transport is client.rac
+    assert client.get_clusters() == ['rac-cluster']
+    assert server.connections == 1
+
+
+def test_unavailable_ras_falls_back_to_rac(ras_server, fake_rac):
+    server = ras_server()
+    host, port = server.server_address
+    server.shutdown()
+    server.server_close()
+    client = ClusterClient(fake_rac, host, port, transport=common_1c.RAS_TRANSPORT)
+
+    assert client.get_clusters() == ['rac-cluster']
+    assert client.transport is client.rac
+
+
+def test_rac_transport(ras_server, fake_rac):
+    server = ras_server()
+    host, port = server.server_address
+    client = ClusterClient(fake_rac, host, port, transport=common_1c.RAC_TRANSPORT)
+
+    assert client.get_clusters() == ['rac-cluster']
+    assert server.connections == 0
+    # Транспорт по умолчанию - утилита rac
+    assert ClusterClient(fake_rac, host, port).transport.name == common_1c.RAC_TRANSPORT
@@ -0,0 +1,59 @@
+"""
+Проверка структуры файла выгрузки 1С (DtVerifier) без запуска 1С.
+"""
+
+import os
+import struct
+
+import backup_1c_base
+
+END_MARK = 0x7fffffff
+
+
+def make_block(data, page_size, next_address=END_MARK):
+    """
+    Блок контейнера формата v8: заголовок блока и страница данных.
+    """
+    header = b'\r\n' + (b'%08x %08x %08x ' % (len(data), page_size, next_address)) + b'\r\n'
+    return header + data.ljust(page_size, b' ')
+
+
+def make_container():
+    """
+    Контейнер формата v8 с одним элементом: оглавление, заголовок и данные элемента.
+    """
+    block_header_size = backup_1c_base.get_dt_block_header_size(8)
+    toc_address = 16
+    element_header_address = toc_address + block_header_size + 512
+    element_data_address = element_header_address + block_header_size + 64
+    toc = struct.pack('<III', element_header_address, element_data_address, END_MARK)
+    return (struct.pack('<IIII', END_MARK, 512, 0, 0) + make_block(toc, 512) +
+            make_block(b'element header', 64) + make_block(b'element data' * 10, 256))
+
+
+def verify(data, **kwargs):
+    verifier = backup_1c_base.DtVerifier(**kwargs)
+    for offset in range(0, len(data), 100):
+        verifier.feed(data[offset:offset + 100])
+    return verifier.finish()
+
+
+def test_valid_container():
+    result = verify(make_container())
+    assert result['result'], result['errors']
+    assert result['format'] == 'v8'
+    assert result['elements'] == 1
+
+
+def test_truncated_container():
+    result = verify(make_container()[:-10])
+    assert not result['result']
+    assert u'обрезан' in result['errors'][0]
+
+
+def test_unrecognized_format_is_error():
+    # Поврежденное начало файла не должно пропускать все проверки структуры
+    result = verify(os.urandom(64 * 1024))
+    assert not result['result']
+    assert result['format'] is None
+    assert u'Формат контейнера не распознан' in result['errors'][0]